@@ -0,0 +1,166 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.config import settings
+
+class AdmissionRejected(Exception):
+    """Requisição recusada pelo controle de admissão"""
+
+    def __init__(self, status_code: int, retry_after: int, motivo: str):
+        super().__init__(motivo)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Controle de admissão para os endpoints que chamam o LLM.
+
+    Limita as gerações simultâneas no total e por cliente. O excedente espera
+    em uma fila limitada, atendida pelo prazo mais próximo primeiro; quando a
+    fila está cheia ou o prazo não pode ser cumprido, a requisição é recusada
+    na hora (503), e clientes acima do próprio limite recebem 429. Deve ser
+    usado apenas a partir do event loop.
+    """
+
+    def __init__(self, max_concorrentes: int, max_por_cliente: int, tamanho_fila: int, espera_maxima: float):
+        self.max_concorrentes = max_concorrentes
+        self.max_por_cliente = max_por_cliente
+        self.tamanho_fila = tamanho_fila
+        self.espera_maxima = espera_maxima
+
+        self._em_execucao = 0
+        self._na_fila = 0
+        # Requisições em execução ou na fila, por cliente
+        self._por_cliente: Dict[str, int] = {}
+        # Heap de [prazo, ordem de chegada, futuro]
+        self._fila: List[list] = []
+        self._ordem = itertools.count()
+        # Média móvel da duração das gerações, usada para estimar esperas
+        self._duracao_media = 5.0
+
+        self._admitidas = 0
+        self._recusadas_cliente = 0
+        self._recusadas_fila = 0
+        self._expiradas = 0
+
+    def _estimar_espera(self, prazo: float) -> float:
+        """Estima a espera de uma requisição com o prazo dado, considerando quem será atendido antes"""
+        a_frente = sum(1 for entrada in self._fila if entrada[0] <= prazo and not entrada[2].done())
+        return self._duracao_media * (a_frente + 1) / self.max_concorrentes
+
+    def _retry_after(self) -> int:
+        espera = self._duracao_media * (self._na_fila + 1) / self.max_concorrentes
+        return max(1, math.ceil(espera))
+
+    def _liberar_cliente(self, cliente: str) -> None:
+        self._por_cliente[cliente] -= 1
+        if not self._por_cliente[cliente]:
+            del self._por_cliente[cliente]
+
+    def _despachar(self) -> None:
+        """Passa as vagas livres às requisições da fila, pelo prazo mais próximo"""
+        agora = time.monotonic()
+        while self._em_execucao < self.max_concorrentes and self._fila:
+            prazo, _, futuro = heapq.heappop(self._fila)
+            if futuro.done():
+                # Expirou ou foi cancelada enquanto esperava
+                continue
+            if prazo <= agora:
+                futuro.set_exception(AdmissionRejected(503, self._retry_after(), "Prazo esgotado na fila"))
+                continue
+            self._em_execucao += 1
+            futuro.set_result(None)
+
+    async def adquirir(self, cliente: str, timeout: Optional[float] = None) -> None:
+        """Aguarda uma vaga de geração ou levanta AdmissionRejected"""
+        agora = time.monotonic()
+        espera = self.espera_maxima if timeout is None else min(timeout, self.espera_maxima)
+        prazo = agora + espera
+
+        if self._por_cliente.get(cliente, 0) >= self.max_por_cliente:
+            self._recusadas_cliente += 1
+            raise AdmissionRejected(429, self._retry_after(), "Limite de requisições simultâneas por cliente atingido")
+
+        if self._em_execucao < self.max_concorrentes and not self._na_fila:
+            self._em_execucao += 1
+            self._por_cliente[cliente] = self._por_cliente.get(cliente, 0) + 1
+            self._admitidas += 1
+            return
+
+        if self._na_fila >= self.tamanho_fila or self._estimar_espera(prazo) > espera:
+            self._recusadas_fila += 1
+            raise AdmissionRejected(503, self._retry_after(), "Servidor sobrecarregado, tente novamente mais tarde")
+
+        futuro = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._fila, [prazo, next(self._ordem), futuro])
+        self._na_fila += 1
+        self._por_cliente[cliente] = self._por_cliente.get(cliente, 0) + 1
+
+        try:
+            await asyncio.wait_for(futuro, timeout=espera)
+        except BaseException as e:
+            self._liberar_cliente(cliente)
+            if futuro.done() and not futuro.cancelled() and futuro.exception() is None:
+                # A vaga foi concedida, mas a requisição desistiu: repassá-la
+                self._em_execucao -= 1
+                self._despachar()
+                raise
+            if isinstance(e, (asyncio.TimeoutError, AdmissionRejected)):
+                self._expiradas += 1
+                raise AdmissionRejected(503, self._retry_after(), "Tempo máximo de espera na fila esgotado") from None
+            raise
+        finally:
+            self._na_fila -= 1
+
+        self._admitidas += 1
+
+    def liberar(self, cliente: str, duracao: float) -> None:
+        """Devolve a vaga de geração e atualiza a duração média"""
+        self._duracao_media = 0.8 * self._duracao_media + 0.2 * duracao
+        self._liberar_cliente(cliente)
+        self._em_execucao -= 1
+        self._despachar()
+
+    @asynccontextmanager
+    async def admitir(self, cliente: str, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Ocupa uma vaga de geração durante o bloco"""
+        await self.adquirir(cliente, timeout)
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            self.liberar(cliente, time.monotonic() - inicio)
+
+    def metricas(self) -> dict:
+        """Retorna o estado atual da fila e os contadores de admissão"""
+        return {
+            "em_execucao": self._em_execucao,
+            "na_fila": self._na_fila,
+            "clientes_ativos": len(self._por_cliente),
+            "max_concorrentes": self.max_concorrentes,
+            "max_por_cliente": self.max_por_cliente,
+            "tamanho_fila": self.tamanho_fila,
+            "espera_maxima": self.espera_maxima,
+            "duracao_media": round(self._duracao_media, 3),
+            "admitidas": self._admitidas,
+            "recusadas_por_cliente": self._recusadas_cliente,
+            "recusadas_por_sobrecarga": self._recusadas_fila,
+            "expiradas_na_fila": self._expiradas
+        }
+
+def parcela_por_worker(total: int, workers: int) -> int:
+    """Parcela de um limite global que cabe a cada worker, sem que a soma o ultrapasse"""
+    return total // max(1, workers)
+
+# Cada worker tem o seu controlador; os limites globais são divididos entre eles
+admission_controller = AdmissionController(
+    max_concorrentes=max(1, parcela_por_worker(settings.ADMISSION_MAX_CONCURRENT, settings.WORKERS)),
+    max_por_cliente=settings.ADMISSION_MAX_PER_CLIENT,
+    tamanho_fila=parcela_por_worker(settings.ADMISSION_QUEUE_SIZE, settings.WORKERS),
+    espera_maxima=settings.ADMISSION_MAX_WAIT
+)
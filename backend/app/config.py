@@ -21,13 +21,38 @@ class Settings:
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
     
     # Configurações de processamento
-    CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "2000"))
-    CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "500"))
+    CHUNK_SIZE_TOKENS: int = int(os.getenv("CHUNK_SIZE_TOKENS", "500"))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "125"))
+    TOKENIZER_ENCODING: str = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
     TOP_K_DEFAULT: int = int(os.getenv("TOP_K_DEFAULT", "4"))
     SIMILARITY_THRESHOLD: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.7"))
     
+    # Controle de admissão dos endpoints que chamam o LLM (limites globais, divididos entre os workers)
+    ADMISSION_MAX_CONCURRENT: int = int(os.getenv("ADMISSION_MAX_CONCURRENT", "8"))
+    ADMISSION_MAX_PER_CLIENT: int = int(os.getenv("ADMISSION_MAX_PER_CLIENT", "2"))
+    ADMISSION_QUEUE_SIZE: int = int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+    ADMISSION_MAX_WAIT: float = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+    # Header com o cliente real, definido por um proxy confiável (ex.: X-Forwarded-For)
+    ADMISSION_CLIENT_HEADER: Optional[str] = os.getenv("ADMISSION_CLIENT_HEADER")
+    
+    # Modo multi-worker: endereço do processo dono do índice ("host:porta" ou socket Unix)
+    WORKERS: int = int(os.getenv("WORKERS", "1"))
+    INDEX_SERVER_ADDRESS: Optional[str] = os.getenv("INDEX_SERVER_ADDRESS")
+    # Sem chave configurada, o run.py gera uma aleatória a cada execução e a grava em DB_DIR/index.key
+    INDEX_SERVER_AUTHKEY: Optional[str] = os.getenv("INDEX_SERVER_AUTHKEY")
+    
     # Diretórios
     BASE_DIR: str = os.getenv("BASE_DIR", "base")
     DB_DIR: str = os.getenv("DB_DIR", "db")
+    TEXT_CACHE_DIR: str = os.getenv("TEXT_CACHE_DIR", "cache")
+
+# CHUNK_SIZE e CHUNK_OVERLAP eram medidos em caracteres; aceitá-los como
+# tokens geraria chunks cerca de 4x maiores sem nenhum aviso
+for _variavel in ("CHUNK_SIZE", "CHUNK_OVERLAP"):
+    if os.getenv(_variavel) is not None:
+        raise ValueError(
+            f"{_variavel} não é mais suportada: os chunks agora são medidos em tokens. "
+            f"Use {_variavel}_TOKENS (cerca de 1/4 do valor em caracteres)"
+        )
 
 settings = Settings() 
\ No newline at end of file
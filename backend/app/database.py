@@ -4,11 +4,16 @@ from chromadb.api.models.Collection import Collection
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
 from app.config import settings
+from app.index_client import RemoteVectorStore, descobrir_servidor
 import os
+from typing import List, Optional, Tuple
 
 _client: ClientAPI | None = None
 _collection: Collection | None = None
-_vectorstore: Chroma | None = None
+_vectorstore: Chroma | RemoteVectorStore | None = None
+_collection_version: int = 0
+_index_server: Optional[Tuple[str, Optional[str]]] = None
+_index_server_resolved: bool = False
 
 def get_chroma_client() -> ClientAPI:
     """Retorna uma instância do cliente ChromaDB"""
@@ -37,12 +42,35 @@ def get_chroma_collection(client: ClientAPI = None) -> Collection:
         )
     return _collection
 
-def get_vectorstore() -> Chroma:
+def get_index_server() -> Optional[Tuple[str, Optional[str]]]:
+    """Retorna endereço e chave do processo dono do índice, ou None se o índice é aberto por este processo"""
+    global _index_server, _index_server_resolved
+    if not _index_server_resolved:
+        _index_server = descobrir_servidor(
+            settings.INDEX_SERVER_ADDRESS,
+            settings.INDEX_SERVER_AUTHKEY,
+            settings.DB_DIR
+        )
+        _index_server_resolved = True
+    return _index_server
+
+def set_index_server(servidor: Optional[Tuple[str, Optional[str]]]) -> None:
+    """Define o dono do índice sem descoberta; o próprio dono usa None"""
+    global _index_server, _index_server_resolved
+    _index_server = servidor
+    _index_server_resolved = True
+
+def get_vectorstore() -> Chroma | RemoteVectorStore:
     """Retorna uma instância do vectorstore LangChain com ChromaDB"""
     global _vectorstore
     if _vectorstore is None:
         embeddings = OpenAIEmbeddings()
-        if settings.CHROMA_API_KEY:
+        servidor = get_index_server()
+        if servidor:
+            # Modo multi-worker: o índice pertence ao processo dono do índice
+            endereco, authkey = servidor
+            _vectorstore = RemoteVectorStore(endereco, authkey, embeddings)
+        elif settings.CHROMA_API_KEY:
             # Para ChromaDB Cloud, usar o cliente diretamente
             client = get_chroma_client()
             collection = get_chroma_collection(client)
@@ -59,9 +87,34 @@ def get_vectorstore() -> Chroma:
             )
     return _vectorstore
 
+def buscar_por_vetor(vectorstore: Chroma | RemoteVectorStore, vetor: List[float], k: int = 4) -> List[Tuple]:
+    """Busca pelo embedding já calculado, retornando (documento, score de relevância)"""
+    if isinstance(vectorstore, RemoteVectorStore):
+        return vectorstore.buscar_por_vetor(vetor, k)
+    
+    relevancia = vectorstore._select_relevance_score_fn()
+    resultados = vectorstore.similarity_search_by_vector_with_relevance_scores(vetor, k=k)
+    return [(doc, relevancia(distancia)) for doc, distancia in resultados]
+
+def get_collection_version() -> int:
+    """Retorna a versão da coleção, incrementada a cada alteração do conteúdo"""
+    if get_index_server():
+        return get_vectorstore().versao_colecao()
+    return _collection_version
+
+def bump_collection_version() -> int:
+    """Marca a coleção como alterada"""
+    global _collection_version
+    if get_index_server():
+        return get_vectorstore().incrementar_versao_colecao()
+    _collection_version += 1
+    return _collection_version
+
 def reset_connections():
     """Reseta as conexões (útil para testes)"""
     global _client, _collection, _vectorstore
+    if isinstance(_vectorstore, RemoteVectorStore):
+        _vectorstore.fechar()
     _client = None
     _collection = None
     _vectorstore = None 
\ No newline at end of file
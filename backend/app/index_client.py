@@ -0,0 +1,187 @@
+import ipaddress
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Connection
+from typing import Callable, List, Optional, Tuple, Union
+
+def parse_address(endereco: str) -> Union[str, Tuple[str, int]]:
+    """Converte o endereço do servidor: 'host:porta' usa TCP, qualquer outro valor é um socket Unix"""
+    host, separador, porta = endereco.rpartition(":")
+    if separador and porta.isdigit():
+        return (host or "127.0.0.1", int(porta))
+    return endereco
+
+def endereco_local(endereco: str) -> bool:
+    """Indica se o endereço é um socket Unix ou TCP restrito ao loopback"""
+    endereco = parse_address(endereco)
+    if isinstance(endereco, str):
+        return True
+    host = endereco[0]
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+# Arquivos do dono do índice em DB_DIR: socket Unix padrão e chave gerada pelo run.py
+ARQUIVO_SOCKET = "index.sock"
+ARQUIVO_CHAVE = "index.key"
+
+def salvar_chave(diretorio: str, chave: str) -> str:
+    """Grava a chave do servidor em `diretorio`, legível apenas pelo usuário do processo"""
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, ARQUIVO_CHAVE)
+    temporario = f"{caminho}.tmp"
+    descritor = os.open(temporario, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # Um temporário deixado por outra execução mantém as permissões antigas
+    os.fchmod(descritor, 0o600)
+    with os.fdopen(descritor, "w") as arquivo:
+        arquivo.write(chave)
+    os.replace(temporario, caminho)
+    return caminho
+
+def ler_chave(diretorio: str) -> Optional[str]:
+    """Lê a chave gravada pelo run.py, se houver"""
+    caminho = os.path.join(diretorio, ARQUIVO_CHAVE)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, "r") as arquivo:
+        return arquivo.read().strip() or None
+
+def servidor_ativo(endereco: str, authkey: str) -> bool:
+    """Indica se há um processo dono do índice aceitando conexões no endereço"""
+    try:
+        Client(parse_address(endereco), authkey=authkey.encode()).close()
+        return True
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+
+def descobrir_servidor(endereco: Optional[str], authkey: Optional[str], diretorio: str) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Retorna endereço e chave do processo dono do índice, ou None se o índice
+    deve ser aberto pelo próprio processo.
+
+    Com `endereco` definido, o índice sempre pertence ao servidor. Sem ele,
+    usa o socket padrão em `diretorio` se houver um servidor atendendo ali,
+    como quando scripts são executados com o `run.py --workers N` no ar. A
+    chave vem de `authkey` ou do arquivo gravado pelo run.py.
+    """
+    authkey = authkey or ler_chave(diretorio)
+    if endereco:
+        return endereco, authkey
+
+    endereco = os.path.join(diretorio, ARQUIVO_SOCKET)
+    if authkey and os.path.exists(endereco) and servidor_ativo(endereco, authkey):
+        return endereco, authkey
+    return None
+
+def aguardar_servidor(
+    endereco: str,
+    authkey: str,
+    timeout: float = 30.0,
+    ativo: Optional[Callable[[], bool]] = None
+) -> None:
+    """Bloqueia até o processo dono do índice aceitar conexões, ou falha se ele terminar antes"""
+    limite = time.monotonic() + timeout
+    while True:
+        try:
+            Client(parse_address(endereco), authkey=authkey.encode()).close()
+            return
+        except (FileNotFoundError, ConnectionRefusedError):
+            if ativo is not None and not ativo():
+                raise RuntimeError("Processo dono do índice terminou durante a inicialização")
+            if time.monotonic() > limite:
+                raise TimeoutError(f"Servidor do índice não respondeu em {endereco}")
+            time.sleep(0.1)
+
+class RemoteCollection:
+    """Encaminha operações da coleção ChromaDB para o processo dono do índice"""
+
+    def __init__(self, vectorstore: "RemoteVectorStore"):
+        self._vectorstore = vectorstore
+
+    def count(self) -> int:
+        return self._vectorstore._chamar("colecao", "count")
+
+    def get(self, *args, **kwargs) -> dict:
+        return self._vectorstore._chamar("colecao", "get", *args, **kwargs)
+
+    def delete(self, *args, **kwargs) -> None:
+        return self._vectorstore._chamar("colecao", "delete", *args, **kwargs)
+
+    def upsert(self, *args, **kwargs) -> None:
+        return self._vectorstore._chamar("colecao", "upsert", *args, **kwargs)
+
+class RemoteVectorStore:
+    """
+    Vectorstore usado pelos workers da API no modo multi-worker.
+
+    Os embeddings das perguntas são calculados no próprio worker; só a busca
+    vetorial e as escritas são enviadas ao processo dono do índice, que é o
+    único a abrir o ChromaDB.
+    """
+
+    def __init__(self, endereco: str, authkey: Optional[str], embeddings):
+        if not authkey:
+            raise ValueError(
+                "INDEX_SERVER_AUTHKEY é obrigatória para conectar ao servidor do índice "
+                f"(ou o arquivo {ARQUIVO_CHAVE} gravado pelo run.py em DB_DIR)"
+            )
+        self.embeddings = embeddings
+        self._endereco = parse_address(endereco)
+        self._authkey = authkey.encode()
+        self._conexoes_livres: List[Connection] = []
+        self._lock = threading.Lock()
+        self._collection = RemoteCollection(self)
+
+    def _obter_conexao(self) -> Connection:
+        with self._lock:
+            if self._conexoes_livres:
+                return self._conexoes_livres.pop()
+        return Client(self._endereco, authkey=self._authkey)
+
+    def _chamar(self, operacao: str, *args, **kwargs):
+        """Executa uma operação no processo dono do índice"""
+        conexao = self._obter_conexao()
+        try:
+            conexao.send((operacao, args, kwargs))
+            status, resultado = conexao.recv()
+        except (EOFError, OSError) as e:
+            conexao.close()
+            raise ConnectionError(f"Servidor do índice indisponível: {str(e)}")
+
+        with self._lock:
+            self._conexoes_livres.append(conexao)
+
+        if status == "erro":
+            raise RuntimeError(resultado)
+        return resultado
+
+    def heartbeat(self) -> int:
+        return self._chamar("heartbeat")
+
+    def buscar_por_vetor(self, vetor: List[float], k: int = 4) -> List[Tuple]:
+        """Busca pelo embedding já calculado, retornando (documento, score de relevância)"""
+        return self._chamar("buscar_por_vetor", vetor, k)
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 4) -> List[Tuple]:
+        vetor = self.embeddings.embed_query(query)
+        return self.buscar_por_vetor(vetor, k)
+
+    def versao_colecao(self) -> int:
+        return self._chamar("versao_colecao")
+
+    def incrementar_versao_colecao(self) -> int:
+        return self._chamar("incrementar_versao_colecao")
+
+    def add_documents(self, documentos: List) -> List[str]:
+        return self._chamar("adicionar_documentos", documentos)
+
+    def fechar(self) -> None:
+        """Fecha as conexões abertas com o servidor do índice"""
+        with self._lock:
+            for conexao in self._conexoes_livres:
+                conexao.close()
+            self._conexoes_livres.clear()
@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Connection, Listener
+
+from app.database import (
+    buscar_por_vetor,
+    bump_collection_version,
+    get_collection_version,
+    get_vectorstore,
+    set_index_server
+)
+from app.index_client import parse_address
+
+# Operações da coleção que os workers podem executar remotamente
+OPERACOES_COLECAO = {"count", "get", "delete", "upsert"}
+
+class IndexServer:
+    """Processo dono do índice: único a abrir o ChromaDB, atende os workers da API"""
+
+    def __init__(self, endereco: str, authkey: str):
+        if not authkey:
+            raise ValueError("O servidor do índice exige uma chave de autenticação")
+        self.endereco = parse_address(endereco)
+        self.authkey = authkey.encode()
+        self.vectorstore = get_vectorstore()
+        self._escrita = threading.Lock()
+
+    def _executar(self, operacao: str, args: tuple, kwargs: dict):
+        if operacao == "heartbeat":
+            return time.time_ns()
+        if operacao == "buscar_por_vetor":
+            return buscar_por_vetor(self.vectorstore, *args, **kwargs)
+        if operacao == "versao_colecao":
+            return get_collection_version()
+        if operacao == "incrementar_versao_colecao":
+            return bump_collection_version()
+        if operacao == "adicionar_documentos":
+            with self._escrita:
+                return self.vectorstore.add_documents(*args, **kwargs)
+        if operacao == "colecao":
+            metodo, *argumentos = args
+            if metodo not in OPERACOES_COLECAO:
+                raise ValueError(f"Operação da coleção não permitida: {metodo}")
+            with self._escrita:
+                return getattr(self.vectorstore._collection, metodo)(*argumentos, **kwargs)
+        raise ValueError(f"Operação desconhecida: {operacao}")
+
+    def _atender(self, conexao: Connection) -> None:
+        """Atende as requisições de um worker até ele fechar a conexão"""
+        with conexao:
+            while True:
+                try:
+                    mensagem = conexao.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    operacao, args, kwargs = mensagem
+                    resposta = ("ok", self._executar(operacao, args, kwargs))
+                except Exception as e:
+                    resposta = ("erro", f"{type(e).__name__}: {str(e)}")
+                conexao.send(resposta)
+
+    def servir_para_sempre(self) -> None:
+        if isinstance(self.endereco, str):
+            # Remover socket Unix deixado por uma execução anterior
+            os.makedirs(os.path.dirname(self.endereco) or ".", exist_ok=True)
+            if os.path.exists(self.endereco):
+                os.unlink(self.endereco)
+
+        with Listener(self.endereco, authkey=self.authkey) as listener:
+            if isinstance(self.endereco, str):
+                # Apenas o usuário do processo pode se conectar ao socket
+                os.chmod(self.endereco, 0o600)
+            while True:
+                try:
+                    conexao = listener.accept()
+                except (AuthenticationError, OSError):
+                    continue
+                threading.Thread(target=self._atender, args=(conexao,), daemon=True).start()
+
+def servir(endereco: str, authkey: str) -> None:
+    """Ponto de entrada do processo dono do índice"""
+    # Este processo abre o ChromaDB localmente, mesmo herdando o endereço do servidor
+    set_index_server(None)
+    IndexServer(endereco, authkey).servir_para_sempre()
@@ -2,7 +2,7 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import rag, documents
 from app.config import settings
-from app.database import get_chroma_client, get_vectorstore
+from app.database import get_chroma_client, get_index_server, get_vectorstore
 import openai
 
 # Criar aplicação FastAPI
@@ -44,9 +44,13 @@ async def health_check():
         # Verificar ChromaDB
         chroma_status = "healthy"
         try:
-            client = get_chroma_client()
-            # Tentar uma operação simples
-            client.heartbeat()
+            if get_index_server():
+                # Modo multi-worker: o ChromaDB é aberto apenas pelo dono do índice
+                get_vectorstore().heartbeat()
+            else:
+                client = get_chroma_client()
+                # Tentar uma operação simples
+                client.heartbeat()
         except Exception as e:
             chroma_status = f"error: {str(e)}"
         
@@ -78,18 +82,22 @@ async def health_check():
 @app.get("/config")
 async def get_config():
     """Retorna configurações da aplicação (sem informações sensíveis)"""
+    servidor = get_index_server()
     return {
         "app_name": settings.APP_NAME,
         "app_version": settings.APP_VERSION,
         "debug": settings.DEBUG,
-        "chunk_size": settings.CHUNK_SIZE,
-        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "chunk_size": settings.CHUNK_SIZE_TOKENS,
+        "chunk_overlap": settings.CHUNK_OVERLAP_TOKENS,
         "top_k_default": settings.TOP_K_DEFAULT,
         "similarity_threshold": settings.SIMILARITY_THRESHOLD,
         "openai_model": settings.OPENAI_MODEL,
         "chroma_collection": settings.CHROMA_COLLECTION_NAME,
         "base_dir": settings.BASE_DIR,
-        "db_dir": settings.DB_DIR
+        "db_dir": settings.DB_DIR,
+        "workers": settings.WORKERS,
+        "index_server": servidor[0] if servidor else None,
+        "text_cache_dir": settings.TEXT_CACHE_DIR
     }
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File
 from app.models import UploadResponse, FileUploadResponse
 from app.services import DocumentService
-from app.database import get_vectorstore
+from app.database import bump_collection_version, get_vectorstore
 import os
 import shutil
 from pathlib import Path
@@ -74,6 +74,7 @@ async def limpar_banco():
     try:
         vectorstore = get_vectorstore()
         vectorstore._collection.delete(where={})
+        bump_collection_version()
         
         return {
             "mensagem": "Banco vetorial limpo com sucesso",
@@ -1,7 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.admission import AdmissionRejected, admission_controller
 from app.models import PerguntaRequest, PerguntaResponse
 from app.services import RAGService
+from app.singleflight import Reserva
 from app.config import settings
+from typing import Optional
+import asyncio
+import os
+import time
 
 router = APIRouter(prefix="/rag", tags=["RAG"])
 
@@ -9,10 +17,52 @@ def get_rag_service() -> RAGService:
     """Dependency injection para o serviço RAG"""
     return RAGService()
 
+def identificar_cliente(http_request: Request) -> str:
+    """
+    Dependency injection para a identificação do cliente no controle de admissão
+    
+    Usa o endereço de quem abriu a conexão. Atrás de um proxy confiável,
+    `ADMISSION_CLIENT_HEADER` indica o header em que o proxy informa o
+    cliente; se houver vários valores, vale o último, acrescentado pelo proxy.
+    """
+    if settings.ADMISSION_CLIENT_HEADER:
+        valor = http_request.headers.get(settings.ADMISSION_CLIENT_HEADER)
+        if valor:
+            return valor.split(",")[-1].strip()
+    return http_request.client.host if http_request.client else "desconhecido"
+
+def recusar(e: AdmissionRejected) -> HTTPException:
+    """Converte a recusa do controle de admissão em resposta HTTP com Retry-After"""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def abandonar_reserva(reserva: Reserva, erro: BaseException) -> None:
+    """Repassa a quem aguarda a mesma resposta a falha do líder da reserva"""
+    if isinstance(erro, AdmissionRejected):
+        # Quem aguarda não excedeu nenhum limite próprio: para ele a recusa é sobrecarga
+        erro = AdmissionRejected(503, erro.retry_after, "Servidor sobrecarregado, tente novamente mais tarde")
+    elif not isinstance(erro, Exception):
+        erro = RuntimeError("A requisição que gerava esta resposta foi interrompida")
+    reserva.abandonar(erro)
+
+async def aguardar_reserva(reserva: Reserva):
+    """
+    Aguarda o resultado de uma reserva sem ocupar uma thread
+    
+    O shield impede que a desistência desta requisição cancele o resultado
+    compartilhado com as demais.
+    """
+    return await asyncio.shield(asyncio.wrap_future(reserva.futuro))
+
 @router.post("/perguntar", response_model=PerguntaResponse)
 async def fazer_pergunta(
     request: PerguntaRequest,
-    rag_service: RAGService = Depends(get_rag_service)
+    rag_service: RAGService = Depends(get_rag_service),
+    cliente: str = Depends(identificar_cliente),
+    x_request_timeout: Optional[float] = Header(None)
 ):
     """
     Faz uma pergunta usando RAG (Retrieval-Augmented Generation)
@@ -20,13 +70,34 @@ async def fazer_pergunta(
     - **pergunta**: A pergunta do usuário
     - **top_k**: Número máximo de documentos relevantes a buscar (padrão: 4)
     - **threshold**: Limite mínimo de similaridade (padrão: 0.7)
+    
+    O header `X-Request-Timeout` (segundos) limita a espera na fila de geração.
+    Perguntas idênticas a uma que já está na fila ou sendo respondida aguardam
+    a mesma resposta sem ocupar uma vaga, pois não geram outra chamada ao LLM.
     """
     try:
-        resposta, documentos = rag_service.perguntar(
+        reserva = await run_in_threadpool(
+            rag_service.reservar_pergunta,
             pergunta=request.pergunta,
             top_k=request.top_k,
             threshold=request.threshold
         )
+        if reserva.lider:
+            try:
+                async with admission_controller.admitir(cliente, x_request_timeout):
+                    # Executar fora do event loop para que perguntas concorrentes possam ser coalescidas
+                    await run_in_threadpool(
+                        rag_service.responder,
+                        reserva,
+                        pergunta=request.pergunta,
+                        top_k=request.top_k,
+                        threshold=request.threshold
+                    )
+            except BaseException as e:
+                abandonar_reserva(reserva, e)
+                raise
+        
+        resposta, documentos = await aguardar_reserva(reserva)
         
         return PerguntaResponse(
             pergunta=request.pergunta,
@@ -35,12 +106,126 @@ async def fazer_pergunta(
             total_documentos=len(documentos)
         )
     
+    except AdmissionRejected as e:
+        raise recusar(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao processar pergunta: {str(e)}"
         )
 
+class VagaDeGeracao:
+    """Vaga obtida no controle de admissão, liberada uma única vez"""
+    
+    def __init__(self, cliente: str):
+        self.cliente = cliente
+        self.inicio = time.monotonic()
+        self._liberada = False
+        self._loop = asyncio.get_running_loop()
+    
+    def liberar(self) -> None:
+        if not self._liberada:
+            self._liberada = True
+            admission_controller.liberar(self.cliente, time.monotonic() - self.inicio)
+    
+    def liberar_de_outra_thread(self) -> None:
+        """Agenda a liberação no event loop, a partir da thread que consome o LLM"""
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.liberar)
+
+class StreamingCompartilhado(StreamingResponse):
+    """
+    StreamingResponse de um leitor da transmissão compartilhada
+    
+    Ao fim do envio, inclusive quando o cliente desconecta antes do corpo
+    começar ou o envio dos headers falha, o leitor sai da transmissão, que
+    é interrompida se ninguém mais a acompanha.
+    """
+    
+    def __init__(self, conteudo, **kwargs):
+        super().__init__(conteudo, **kwargs)
+        self.conteudo = conteudo
+    
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.conteudo.close()
+
+@router.post("/perguntar/stream")
+async def fazer_pergunta_stream(
+    request: PerguntaRequest,
+    rag_service: RAGService = Depends(get_rag_service),
+    cliente: str = Depends(identificar_cliente),
+    x_request_timeout: Optional[float] = Header(None)
+):
+    """
+    Faz uma pergunta usando RAG e devolve a resposta em streaming (texto puro)
+    
+    Quem envia a mesma pergunta enquanto uma resposta idêntica está na fila ou
+    sendo gerada passa a acompanhá-la, recebendo também o que já foi gerado,
+    sem ocupar uma vaga. A vaga de quem inicia a geração é mantida até ela
+    terminar ou ser interrompida.
+    """
+    while True:
+        try:
+            reserva = await run_in_threadpool(
+                rag_service.reservar_stream,
+                pergunta=request.pergunta,
+                top_k=request.top_k,
+                threshold=request.threshold
+            )
+            if reserva.lider:
+                try:
+                    await admission_controller.adquirir(cliente, x_request_timeout)
+                except BaseException as e:
+                    abandonar_reserva(reserva, e)
+                    raise
+                
+                vaga = VagaDeGeracao(cliente)
+                try:
+                    rag_service.iniciar_stream(
+                        reserva,
+                        pergunta=request.pergunta,
+                        top_k=request.top_k,
+                        threshold=request.threshold,
+                        ao_encerrar=vaga.liberar_de_outra_thread
+                    )
+                except BaseException:
+                    vaga.liberar()
+                    raise
+            
+            transmissao = await aguardar_reserva(reserva)
+            partes = await run_in_threadpool(rag_service.acompanhar_stream, transmissao)
+        except AdmissionRejected as e:
+            raise recusar(e)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Erro ao processar pergunta: {str(e)}"
+            )
+        
+        if partes is not None:
+            return StreamingCompartilhado(partes, media_type="text/plain; charset=utf-8")
+        # Todos os leitores desistiram da geração antes de esta requisição
+        # entrar nela: reservar uma nova
+
+@router.get("/admissao")
+async def metricas_admissao():
+    """
+    Retorna a profundidade da fila e os contadores do controle de admissão
+    
+    No modo multi-worker, cada worker tem a sua parcela dos limites globais e
+    responde com as próprias métricas, identificadas por `worker_pid`.
+    """
+    return {
+        "worker_pid": os.getpid(),
+        "workers": settings.WORKERS,
+        "max_concorrentes_global": settings.ADMISSION_MAX_CONCURRENT,
+        "tamanho_fila_global": settings.ADMISSION_QUEUE_SIZE,
+        **admission_controller.metricas()
+    }
+
 @router.get("/health")
 async def health_check():
     """Verifica o status do serviço RAG"""
@@ -48,4 +233,4 @@ async def health_check():
         "status": "healthy",
         "service": "RAG",
         "model": settings.OPENAI_MODEL
-    } 
\ No newline at end of file
+    }
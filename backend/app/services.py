@@ -1,34 +1,171 @@
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.schema import Document
 from langchain.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
-from app.database import get_vectorstore
+from app.database import buscar_por_vetor, bump_collection_version, get_collection_version, get_vectorstore
 from app.config import settings
 from app.models import DocumentoResponse
+from app.singleflight import Reserva, SharedStream, SingleFlight, StreamCancelled
+from app.text_cache import TextCache
 import os
-from typing import List, Tuple
+import re
+import tiktoken
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+class PageTokenSplitter:
+    """
+    Divide páginas em chunks medidos em tokens do modelo.
+
+    Cada página é tokenizada uma única vez e percorrida em uma passada linear;
+    os chunks nunca atravessam páginas e são cortados preferencialmente em
+    fronteiras de parágrafo, depois de linha, de frase e de palavra. Durante a
+    divisão só são guardados offsets; o texto dos chunks é copiado no final.
+    """
+    
+    # Força de cada fronteira: quanto maior, melhor o ponto de corte
+    _FORCAS = {"paragrafo": 4, "linha": 3, "frase": 2, "palavra": 1}
+    _FRONTEIRAS = re.compile(
+        r"(?P<paragrafo>[ \t]*\n[ \t]*\n\s*)"
+        r"|(?P<linha>[ \t]*\n\s*)"
+        r"|(?P<frase>(?<=[.!?])[ \t]+)"
+        r"|(?P<palavra>[ \t]+)"
+    )
+    
+    def __init__(self, chunk_size: int, chunk_overlap: int, encoding_name: str = "cl100k_base"):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size ({chunk_size}) deve ser maior que zero")
+        if chunk_overlap < 0:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) não pode ser negativo")
+        if chunk_overlap >= chunk_size:
+            raise ValueError(
+                f"chunk_overlap ({chunk_overlap}) deve ser menor que chunk_size ({chunk_size})"
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding = tiktoken.get_encoding(encoding_name)
+    
+    def _forcas_de_corte(self, texto: str, offsets: List[int]) -> List[int]:
+        """Calcula, para cada token, a força de um corte imediatamente antes dele"""
+        forcas = [0] * len(offsets)
+        token = 0
+        for fronteira in self._FRONTEIRAS.finditer(texto):
+            # Último token que começa antes do fim da fronteira
+            posicao = fronteira.end()
+            while token + 1 < len(offsets) and offsets[token + 1] <= posicao:
+                token += 1
+            forca = self._FORCAS[fronteira.lastgroup]
+            if forca > forcas[token]:
+                forcas[token] = forca
+        forcas[0] = 0
+        return forcas
+    
+    def _dividir_pagina(self, texto: str) -> List[Tuple[int, int]]:
+        """Retorna os intervalos (início, fim) em caracteres dos chunks de uma página"""
+        tokens = self.encoding.encode_ordinary(texto)
+        if not tokens:
+            return []
+        _, offsets = self.encoding.decode_with_offsets(tokens)
+        forcas = self._forcas_de_corte(texto, offsets)
+        total = len(tokens)
+        forca_maxima = max(self._FORCAS.values())
+        
+        intervalos = []
+        inicio = 0
+        while inicio < total:
+            fim = min(inicio + self.chunk_size, total)
+            if fim < total:
+                # Procurar o melhor corte na segunda metade da janela
+                melhor, melhor_forca = fim, 0
+                for candidato in range(fim, inicio + self.chunk_size // 2, -1):
+                    if forcas[candidato] > melhor_forca:
+                        melhor, melhor_forca = candidato, forcas[candidato]
+                        if melhor_forca == forca_maxima:
+                            break
+                fim = melhor
+            
+            inicio_texto = offsets[inicio]
+            fim_texto = offsets[fim] if fim < total else len(texto)
+            intervalos.append((inicio_texto, fim_texto))
+            if fim >= total:
+                break
+            
+            # A sobreposição começa na primeira fronteira de palavra disponível
+            # e nunca passa da metade do chunk, garantindo o avanço
+            sobreposicao = min(self.chunk_overlap, (fim - inicio) // 2)
+            proximo = fim - sobreposicao
+            while proximo < fim and forcas[proximo] == 0:
+                proximo += 1
+            inicio = proximo
+        
+        return intervalos
+    
+    def split_documents(self, documentos: List) -> List:
+        """Divide documentos (um por página) em chunks com `start_index` nos metadados"""
+        intervalos = []
+        for indice, documento in enumerate(documentos):
+            texto = documento.page_content
+            for inicio, fim in self._dividir_pagina(texto):
+                # Descartar espaços nas bordas sem copiar o texto
+                while inicio < fim and texto[inicio].isspace():
+                    inicio += 1
+                while fim > inicio and texto[fim - 1].isspace():
+                    fim -= 1
+                if inicio < fim:
+                    intervalos.append((indice, inicio, fim))
+        
+        return [
+            Document(
+                page_content=documentos[indice].page_content[inicio:fim],
+                metadata={**documentos[indice].metadata, "start_index": inicio}
+            )
+            for indice, inicio, fim in intervalos
+        ]
 
 class DocumentService:
     """Serviço para processamento de documentos"""
     
     @staticmethod
-    def carregar_documentos() -> List:
-        """Carrega documentos PDF da pasta base"""
+    def carregar_documentos(somente_cache: bool = False) -> List:
+        """
+        Carrega documentos PDF da pasta base, uma página por documento.
+
+        O texto de cada página é lido do cache de extração quando disponível;
+        o pypdf só é usado para arquivos novos ou alterados. Com
+        `somente_cache=True`, arquivos sem texto em cache geram erro em vez
+        de serem extraídos.
+        """
         if not os.path.exists(settings.BASE_DIR):
             raise FileNotFoundError(f"Diretório {settings.BASE_DIR} não encontrado")
         
-        carregador = PyPDFDirectoryLoader(settings.BASE_DIR, glob="*.pdf")
-        documentos = carregador.load()
+        cache = TextCache()
+        documentos = []
+        for caminho in sorted(Path(settings.BASE_DIR).glob("*.pdf")):
+            hash_arquivo = cache.hash_arquivo(str(caminho))
+            paginas = cache.obter(hash_arquivo)
+            
+            if paginas is None:
+                if somente_cache:
+                    raise FileNotFoundError(f"Texto extraído de {caminho.name} não encontrado no cache")
+                paginas = [pagina.page_content for pagina in PyPDFLoader(str(caminho)).load()]
+                cache.salvar(hash_arquivo, paginas)
+            
+            for numero, texto in enumerate(paginas):
+                documentos.append(Document(
+                    page_content=texto,
+                    metadata={"source": str(caminho), "page": numero}
+                ))
+        
         return documentos
     
     @staticmethod
-    def dividir_chunks(documentos: List) -> List:
-        """Divide documentos em chunks menores"""
-        separador = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP,
-            length_function=len,
-            add_start_index=True
+    def dividir_chunks(documentos: List, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> List:
+        """Divide documentos em chunks menores, medidos em tokens"""
+        separador = PageTokenSplitter(
+            chunk_size=settings.CHUNK_SIZE_TOKENS if chunk_size is None else chunk_size,
+            chunk_overlap=settings.CHUNK_OVERLAP_TOKENS if chunk_overlap is None else chunk_overlap,
+            encoding_name=settings.TOKENIZER_ENCODING
         )
         chunks = separador.split_documents(documentos)
         return chunks
@@ -42,11 +179,39 @@ class DocumentService:
         # Criar vectorstore
         vectorstore = get_vectorstore()
         vectorstore.add_documents(chunks)
+        bump_collection_version()
+        
+        return len(documentos), len(chunks)
+    
+    @staticmethod
+    def reprocessar_do_cache(chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> Tuple[int, int]:
+        """Recria chunks e embeddings usando apenas o texto em cache, sem reabrir os PDFs"""
+        documentos = DocumentService.carregar_documentos(somente_cache=True)
+        chunks = DocumentService.dividir_chunks(documentos, chunk_size, chunk_overlap)
+        
+        # Substituir os chunks antigos pelos novos; os antigos só são removidos
+        # depois que os novos foram gravados, para uma falha não esvaziar o banco
+        vectorstore = get_vectorstore()
+        ids_antigos = vectorstore._collection.get(include=[])["ids"]
+        if chunks:
+            vectorstore.add_documents(chunks)
+        if ids_antigos:
+            vectorstore._collection.delete(ids=ids_antigos)
+        bump_collection_version()
         
         return len(documentos), len(chunks)
 
+# Compartilhado entre as instâncias de RAGService (uma por requisição) do processo
+_em_andamento = SingleFlight()
+
 class RAGService:
-    """Serviço para RAG (Retrieval-Augmented Generation)"""
+    """
+    Serviço para RAG (Retrieval-Augmented Generation)
+    
+    Requisições concorrentes idênticas (mesma pergunta normalizada, `top_k`,
+    `threshold` e versão da coleção) compartilham o mesmo embedding, a mesma
+    busca e a mesma chamada ao LLM enquanto estiverem em andamento.
+    """
     
     def __init__(self):
         self.vectorstore = get_vectorstore()
@@ -63,12 +228,20 @@ class RAGService:
         indique claramente que não possui informações suficientes na base de conhecimento.
         """)
     
+    @staticmethod
+    def normalizar_pergunta(pergunta: str) -> str:
+        """Normaliza a pergunta para identificar requisições idênticas"""
+        return " ".join(pergunta.split()).casefold()
+    
+    def _buscar_por_similaridade(self, pergunta: str, top_k: int) -> List[Tuple]:
+        chave_embedding = ("embedding", self.normalizar_pergunta(pergunta))
+        vetor = _em_andamento.executar(chave_embedding, self.vectorstore.embeddings.embed_query, pergunta.strip())
+        return buscar_por_vetor(self.vectorstore, vetor, top_k)
+    
     def buscar_documentos_relevantes(self, pergunta: str, top_k: int = 4, threshold: float = 0.7) -> List[Tuple]:
         """Busca documentos relevantes para a pergunta"""
-        resultados = self.vectorstore.similarity_search_with_relevance_scores(
-            pergunta, 
-            k=top_k
-        )
+        chave = ("busca", self.normalizar_pergunta(pergunta), top_k, get_collection_version())
+        resultados = _em_andamento.executar(chave, self._buscar_por_similaridade, pergunta, top_k)
         
         # Filtrar por threshold
         resultados_filtrados = [
@@ -78,11 +251,7 @@ class RAGService:
         
         return resultados_filtrados
     
-    def gerar_resposta(self, pergunta: str, documentos: List[Tuple]) -> str:
-        """Gera resposta usando os documentos encontrados"""
-        if not documentos:
-            return "Não consegui encontrar informações relevantes na base de conhecimento para responder sua pergunta."
-        
+    def _montar_prompt(self, pergunta: str, documentos: List[Tuple]):
         # Preparar contexto
         textos_contexto = []
         for doc, _ in documentos:
@@ -90,17 +259,22 @@ class RAGService:
         
         base_conhecimento = "\n\n----\n\n".join(textos_contexto)
         
-        # Gerar resposta
-        prompt = self.prompt_template.invoke({
+        return self.prompt_template.invoke({
             "pergunta": pergunta, 
             "base_conhecimento": base_conhecimento
         })
+    
+    def gerar_resposta(self, pergunta: str, documentos: List[Tuple]) -> str:
+        """Gera resposta usando os documentos encontrados"""
+        if not documentos:
+            return "Não consegui encontrar informações relevantes na base de conhecimento para responder sua pergunta."
         
+        # Gerar resposta
+        prompt = self._montar_prompt(pergunta, documentos)
         resposta = self.llm.invoke(prompt).content
         return resposta
     
-    def perguntar(self, pergunta: str, top_k: int = 4, threshold: float = 0.7) -> Tuple[str, List[DocumentoResponse]]:
-        """Processa uma pergunta completa usando RAG"""
+    def _perguntar(self, pergunta: str, top_k: int, threshold: float) -> Tuple[str, List[DocumentoResponse]]:
         documentos_relevantes = self.buscar_documentos_relevantes(pergunta, top_k, threshold)
         
         resposta = self.gerar_resposta(pergunta, documentos_relevantes)
@@ -114,4 +288,87 @@ class RAGService:
                 metadata=doc.metadata
             ))
         
-        return resposta, documentos_response 
\ No newline at end of file
+        return resposta, documentos_response
+    
+    def _chave(self, tipo: str, pergunta: str, top_k: int, threshold: float) -> tuple:
+        return (tipo, self.normalizar_pergunta(pergunta), top_k, threshold, get_collection_version())
+    
+    def reservar_pergunta(self, pergunta: str, top_k: int = 4, threshold: float = 0.7) -> Reserva:
+        """
+        Reserva a resposta de uma pergunta antes de ela entrar na fila de geração
+        
+        Só o líder da reserva executa a pergunta, com `responder`; requisições
+        idênticas recebem a mesma reserva e aguardam o seu futuro.
+        """
+        return _em_andamento.reservar(self._chave("pergunta", pergunta, top_k, threshold))
+    
+    def responder(self, reserva: Reserva, pergunta: str, top_k: int = 4, threshold: float = 0.7) -> Tuple[str, List[DocumentoResponse]]:
+        """Executa a pergunta reservada, entregando a resposta a todos que a aguardam"""
+        return reserva.concluir(self._perguntar, pergunta, top_k, threshold)
+    
+    def perguntar(self, pergunta: str, top_k: int = 4, threshold: float = 0.7) -> Tuple[str, List[DocumentoResponse]]:
+        """Processa uma pergunta completa usando RAG"""
+        chave = self._chave("pergunta", pergunta, top_k, threshold)
+        return _em_andamento.executar(chave, self._perguntar, pergunta, top_k, threshold)
+    
+    def _gerar_resposta_stream(self, pergunta: str, top_k: int, threshold: float) -> Iterator[str]:
+        documentos_relevantes = self.buscar_documentos_relevantes(pergunta, top_k, threshold)
+        if not documentos_relevantes:
+            yield self.gerar_resposta(pergunta, documentos_relevantes)
+            return
+        
+        prompt = self._montar_prompt(pergunta, documentos_relevantes)
+        # Fechado explicitamente se a transmissão for interrompida no meio
+        with closing(self.llm.stream(prompt)) as partes:
+            for parte in partes:
+                yield parte.content
+    
+    def reservar_stream(self, pergunta: str, top_k: int = 4, threshold: float = 0.7) -> Reserva:
+        """
+        Reserva a resposta em streaming de uma pergunta, como `reservar_pergunta`
+        
+        O futuro da reserva recebe a SharedStream da geração: a que já está em
+        andamento ou a que o líder inicia com `iniciar_stream`.
+        """
+        return _em_andamento.reservar_transmissao(self._chave("stream", pergunta, top_k, threshold))
+    
+    def iniciar_stream(
+        self,
+        reserva: Reserva,
+        pergunta: str,
+        top_k: int = 4,
+        threshold: float = 0.7,
+        ao_encerrar: Optional[Callable[[], None]] = None
+    ) -> SharedStream:
+        """
+        Inicia a geração reservada, sem bloquear
+        
+        `ao_encerrar` é chamado, na thread que consome o LLM, quando a geração
+        terminar ou for interrompida.
+        """
+        def transmitir() -> SharedStream:
+            transmissao = _em_andamento.transmitir(
+                reserva.chave,
+                lambda: self._gerar_resposta_stream(pergunta, top_k, threshold)
+            )
+            if ao_encerrar is not None:
+                transmissao.ao_encerrar(ao_encerrar)
+            return transmissao
+        
+        return reserva.concluir(transmitir)
+    
+    @staticmethod
+    def acompanhar_stream(transmissao: SharedStream) -> Optional[Iterator[str]]:
+        """
+        Passa a acompanhar uma geração em streaming, devolvendo as partes à medida que são geradas
+        
+        Falhas na busca ou no início da geração são levantadas aqui, antes de a
+        resposta HTTP começar, para que virem erro 500 como em `perguntar`.
+        Retorna None se a geração foi interrompida porque todos os leitores
+        desistiram dela antes de este entrar.
+        """
+        transmissao.aguardar_inicio()
+        try:
+            return transmissao.acompanhar()
+        except StreamCancelled:
+            return None
@@ -0,0 +1,231 @@
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional
+
+class StreamCancelled(Exception):
+    """Transmissão interrompida porque todos os leitores desistiram dela"""
+
+class SharedStream:
+    """
+    Resposta em streaming compartilhada entre vários leitores.
+
+    Um único produtor consome o gerador em uma thread própria; quem chega
+    depois recebe as partes já geradas e acompanha o restante ao vivo. Quando
+    o último leitor desiste, o produtor para e fecha o gerador.
+    """
+
+    def __init__(self, gerador: Iterable[str], ao_terminar: Callable[["SharedStream"], None]):
+        self._partes: List[str] = []
+        self._terminou = False
+        self._erro: Optional[BaseException] = None
+        self._leitores = 0
+        self._teve_leitor = False
+        self._cancelada = False
+        self._condicao = threading.Condition()
+        self._ao_terminar = ao_terminar
+        self._ao_encerrar: List[Callable[[], None]] = []
+        threading.Thread(target=self._produzir, args=(gerador,), daemon=True).start()
+
+    @property
+    def cancelada(self) -> bool:
+        return self._cancelada
+
+    def _produzir(self, gerador: Iterable[str]) -> None:
+        try:
+            try:
+                for parte in gerador:
+                    with self._condicao:
+                        self._partes.append(parte)
+                        self._condicao.notify_all()
+                        if self._teve_leitor and not self._leitores:
+                            self._cancelada = True
+                            break
+            finally:
+                # Fechar o gerador interrompe também a chamada ao LLM por trás dele
+                fechar = getattr(gerador, "close", None)
+                if fechar is not None:
+                    fechar()
+        except BaseException as e:
+            self._erro = e
+        finally:
+            self._ao_terminar(self)
+            with self._condicao:
+                self._terminou = True
+                self._condicao.notify_all()
+            for callback in self._ao_encerrar:
+                callback()
+
+    def ao_encerrar(self, callback: Callable[[], None]) -> None:
+        """Chama `callback`, na thread do produtor, quando a geração terminar (na hora, se já terminou)"""
+        with self._condicao:
+            if not self._terminou:
+                self._ao_encerrar.append(callback)
+                return
+        callback()
+
+    def aguardar_inicio(self) -> None:
+        """Bloqueia até a primeira parte ser gerada; levanta o erro do produtor se ele falhar antes disso"""
+        with self._condicao:
+            self._condicao.wait_for(lambda: self._partes or self._terminou)
+            if not self._partes and self._erro is not None:
+                raise self._erro
+
+    def acompanhar(self) -> Iterator[str]:
+        """
+        Registra um leitor e retorna um iterador sobre todas as partes, desde a
+        primeira, até o fim da geração.
+
+        O leitor sai da transmissão ao chegar ao fim ou ao ter o iterador
+        fechado com `close()`. Levanta StreamCancelled se a transmissão já foi
+        interrompida por falta de leitores.
+        """
+        with self._condicao:
+            if self._cancelada:
+                raise StreamCancelled("Transmissão interrompida por falta de leitores")
+            self._leitores += 1
+            self._teve_leitor = True
+        return _Leitor(self)
+
+class _Leitor:
+    """Iterador de um leitor de SharedStream"""
+
+    def __init__(self, transmissao: SharedStream):
+        self._transmissao = transmissao
+        self._indice = 0
+        self._fechado = False
+
+    def __iter__(self) -> "_Leitor":
+        return self
+
+    def __next__(self) -> str:
+        transmissao = self._transmissao
+        with transmissao._condicao:
+            transmissao._condicao.wait_for(
+                lambda: self._fechado or self._indice < len(transmissao._partes) or transmissao._terminou
+            )
+            if self._fechado:
+                raise StopIteration
+            if self._indice < len(transmissao._partes):
+                self._indice += 1
+                return transmissao._partes[self._indice - 1]
+
+        self.close()
+        if transmissao._erro is not None:
+            raise transmissao._erro
+        raise StopIteration
+
+    def close(self) -> None:
+        """Sai da transmissão; pode ser chamado de outra thread e mais de uma vez"""
+        transmissao = self._transmissao
+        with transmissao._condicao:
+            if self._fechado:
+                return
+            self._fechado = True
+            transmissao._leitores -= 1
+            transmissao._condicao.notify_all()
+
+class Reserva:
+    """
+    Execução reservada em um SingleFlight.
+
+    Só o líder conclui a reserva, executando o trabalho com `concluir` ou
+    desistindo com `abandonar`; os demais aguardam `futuro`, que recebe o
+    resultado ou a exceção do líder.
+    """
+
+    def __init__(self, coalescidas: "SingleFlight", chave: Hashable, futuro: Future, lider: bool):
+        self.chave = chave
+        self.futuro = futuro
+        self.lider = lider
+        self._coalescidas = coalescidas
+
+    def concluir(self, funcao: Callable, *args):
+        """Executa `funcao(*args)` e entrega o resultado (ou a exceção) a quem aguarda"""
+        try:
+            resultado = funcao(*args)
+        except BaseException as e:
+            self.abandonar(e)
+            raise
+        self._entregar(self.futuro.set_result, resultado)
+        return resultado
+
+    def abandonar(self, erro: BaseException) -> None:
+        """Entrega `erro` a quem aguarda; não tem efeito se a reserva já foi concluída"""
+        self._entregar(self.futuro.set_exception, erro)
+
+    def _entregar(self, definir: Callable, valor) -> None:
+        try:
+            definir(valor)
+        except InvalidStateError:
+            # Já concluída ou abandonada: vale o primeiro desfecho
+            return
+        finally:
+            self._coalescidas._liberar(self.chave, self.futuro)
+
+class SingleFlight:
+    """
+    Coalesce trabalho idêntico em andamento.
+
+    Chamadas concorrentes com a mesma chave compartilham uma única execução:
+    a primeira executa a função e as demais aguardam o mesmo resultado (ou a
+    mesma exceção). A chave é liberada assim que a execução termina, então o
+    resultado não é guardado como cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_andamento: Dict[Hashable, Future] = {}
+        self._transmissoes: Dict[Hashable, SharedStream] = {}
+
+    def reservar(self, chave: Hashable) -> Reserva:
+        """Reserva a execução da chave, ou retorna uma reserva para aguardar a que já está em andamento"""
+        with self._lock:
+            return self._reservar(chave)
+
+    def _reservar(self, chave: Hashable) -> Reserva:
+        futuro = self._em_andamento.get(chave)
+        if futuro is not None:
+            return Reserva(self, chave, futuro, lider=False)
+        futuro = Future()
+        self._em_andamento[chave] = futuro
+        return Reserva(self, chave, futuro, lider=True)
+
+    def _liberar(self, chave: Hashable, futuro: Future) -> None:
+        with self._lock:
+            if self._em_andamento.get(chave) is futuro:
+                del self._em_andamento[chave]
+
+    def executar(self, chave: Hashable, funcao: Callable, *args):
+        """Executa `funcao(*args)` ou aguarda a execução já em andamento para a chave"""
+        reserva = self.reservar(chave)
+        if not reserva.lider:
+            return reserva.futuro.result()
+        return reserva.concluir(funcao, *args)
+
+    def reservar_transmissao(self, chave: Hashable) -> Reserva:
+        """
+        Como `reservar`, para streaming: o líder inicia a transmissão com
+        `transmitir` dentro de `concluir`. Se ela já estiver em andamento, a
+        reserva retornada já vem concluída com a SharedStream.
+        """
+        with self._lock:
+            transmissao = self._transmissoes.get(chave)
+            if transmissao is not None and not transmissao.cancelada:
+                futuro = Future()
+                futuro.set_result(transmissao)
+                return Reserva(self, chave, futuro, lider=False)
+            return self._reservar(chave)
+
+    def transmitir(self, chave: Hashable, gerar: Callable[[], Iterable[str]]) -> SharedStream:
+        """Retorna o streaming em andamento para a chave, ou inicia um novo com `gerar()`"""
+        with self._lock:
+            transmissao = self._transmissoes.get(chave)
+            if transmissao is None or transmissao.cancelada:
+                transmissao = SharedStream(gerar(), lambda t: self._encerrar_transmissao(chave, t))
+                self._transmissoes[chave] = transmissao
+        return transmissao
+
+    def _encerrar_transmissao(self, chave: Hashable, transmissao: SharedStream) -> None:
+        with self._lock:
+            if self._transmissoes.get(chave) is transmissao:
+                del self._transmissoes[chave]
@@ -0,0 +1,308 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Set
+
+import numpy as np
+
+from app.config import settings
+from app.database import bump_collection_version, get_vectorstore
+
+FORMATO = "pdfrag-snapshot"
+VERSAO_FORMATO = 1
+DTYPE = "<f4"
+
+ARQUIVO_MANIFESTO = "manifest.json"
+ARQUIVO_VETORES = "vectors.f32"
+# Colunas gravadas como JSON Lines, uma linha por chunk, na mesma ordem dos vetores
+COLUNAS = ("ids", "documents", "metadatas")
+ARQUIVO_REMOVIDOS = "removidos.jsonl"
+
+TAMANHO_LOTE = 1000
+
+class SnapshotError(Exception):
+    """Snapshot inválido, corrompido ou incompatível com o banco de destino"""
+
+class _ArquivoComHash:
+    """Arquivo de escrita que calcula o SHA-256 do conteúdo enquanto grava"""
+
+    def __init__(self, caminho: str):
+        self._arquivo = open(caminho, "wb")
+        self._sha = hashlib.sha256()
+        self.tamanho = 0
+
+    def write(self, dados: bytes) -> None:
+        self._arquivo.write(dados)
+        self._sha.update(dados)
+        self.tamanho += len(dados)
+
+    def escrever_linha(self, valor) -> None:
+        self.write(json.dumps(valor, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def fechar(self) -> dict:
+        self._arquivo.close()
+        return {"sha256": self._sha.hexdigest(), "bytes": self.tamanho}
+
+def _ler_linhas(caminho: str) -> Iterator:
+    with open(caminho, "r", encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            yield json.loads(linha)
+
+def _hash_arquivo(caminho: str) -> str:
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def _arquivo_estado() -> str:
+    """Arquivo que guarda o último snapshot importado neste banco"""
+    return os.path.join(settings.DB_DIR, "snapshot.json")
+
+class Snapshot:
+    """
+    Snapshot carregado do disco.
+
+    Os vetores são mapeados com mmap, sem cópia; as colunas de texto e
+    metadados são lidas sob demanda.
+    """
+
+    def __init__(self, diretorio: str, verificar: bool = True):
+        self.diretorio = diretorio
+        caminho_manifesto = os.path.join(diretorio, ARQUIVO_MANIFESTO)
+        if not os.path.exists(caminho_manifesto):
+            raise SnapshotError(f"Manifesto não encontrado em {diretorio}")
+
+        with open(caminho_manifesto, "r", encoding="utf-8") as arquivo:
+            self.manifesto = json.load(arquivo)
+
+        if self.manifesto.get("formato") != FORMATO:
+            raise SnapshotError("Diretório não contém um snapshot do PDF RAG")
+        if self.manifesto.get("versao") != VERSAO_FORMATO:
+            raise SnapshotError(f"Versão de snapshot não suportada: {self.manifesto.get('versao')}")
+
+        if verificar:
+            self.verificar()
+
+        total, dimensao = self.manifesto["total"], self.manifesto["dimensao"]
+        if total and dimensao:
+            self.vetores = np.memmap(
+                os.path.join(diretorio, ARQUIVO_VETORES),
+                dtype=self.manifesto["dtype"],
+                mode="r",
+                shape=(total, dimensao)
+            )
+        else:
+            self.vetores = np.empty((0, dimensao), dtype=self.manifesto["dtype"])
+
+    @property
+    def id(self) -> str:
+        return self.manifesto["id"]
+
+    @property
+    def base(self) -> Optional[str]:
+        return self.manifesto.get("base")
+
+    def verificar(self) -> None:
+        """Confere tamanho e checksum de todos os arquivos do snapshot"""
+        for nome, esperado in self.manifesto["arquivos"].items():
+            caminho = os.path.join(self.diretorio, nome)
+            if not os.path.exists(caminho) or os.path.getsize(caminho) != esperado["bytes"]:
+                raise SnapshotError(f"Arquivo ausente ou truncado: {nome}")
+            if _hash_arquivo(caminho) != esperado["sha256"]:
+                raise SnapshotError(f"Checksum inválido: {nome}")
+
+    def coluna(self, nome: str) -> Iterator:
+        """Itera sobre os valores de uma coluna, na ordem dos vetores"""
+        return _ler_linhas(os.path.join(self.diretorio, f"{nome}.jsonl"))
+
+    def removidos(self) -> Iterator[str]:
+        """Itera sobre os ids removidos desde o snapshot base (apenas em deltas)"""
+        caminho = os.path.join(self.diretorio, ARQUIVO_REMOVIDOS)
+        if not os.path.exists(caminho):
+            return iter(())
+        return _ler_linhas(caminho)
+
+def _ids_do_snapshot(diretorio: str) -> Set[str]:
+    """Ids presentes no banco quando o snapshot foi gerado, seguindo a cadeia de deltas"""
+    snapshot = Snapshot(diretorio, verificar=False)
+    ids = set()
+    if snapshot.base:
+        caminho_base = snapshot.manifesto.get("caminho_base")
+        if not caminho_base or not os.path.exists(caminho_base):
+            raise SnapshotError(f"Snapshot base {snapshot.base} não encontrado")
+        ids = _ids_do_snapshot(caminho_base)
+    ids.difference_update(snapshot.removidos())
+    ids.update(snapshot.coluna("ids"))
+    return ids
+
+def exportar_snapshot(destino: str, base: Optional[str] = None) -> dict:
+    """
+    Exporta a coleção para um snapshot em `destino`, em lotes.
+
+    Com `base`, gera um snapshot delta contendo apenas os chunks novos em
+    relação ao snapshot base e a lista dos ids removidos. Os chunks nunca
+    são alterados depois de criados, então ids iguais têm o mesmo conteúdo.
+    """
+    if os.path.exists(destino):
+        raise FileExistsError(f"Destino {destino} já existe")
+
+    snapshot_base = Snapshot(base, verificar=False) if base else None
+    ids_base = _ids_do_snapshot(base) if base else set()
+
+    temporario = f"{destino}.tmp"
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    colecao = get_vectorstore()._collection
+    vetores = _ArquivoComHash(os.path.join(temporario, ARQUIVO_VETORES))
+    colunas = {nome: _ArquivoComHash(os.path.join(temporario, f"{nome}.jsonl")) for nome in COLUNAS}
+    ids_atuais = set()
+    total, dimensao = 0, 0
+
+    try:
+        deslocamento = 0
+        while True:
+            lote = colecao.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=TAMANHO_LOTE,
+                offset=deslocamento
+            )
+            if not lote["ids"]:
+                break
+            deslocamento += len(lote["ids"])
+
+            for indice, id_chunk in enumerate(lote["ids"]):
+                ids_atuais.add(id_chunk)
+                if id_chunk in ids_base:
+                    continue
+
+                vetor = np.asarray(lote["embeddings"][indice], dtype=DTYPE)
+                dimensao = dimensao or vetor.shape[0]
+                if vetor.shape[0] != dimensao:
+                    raise SnapshotError(f"Dimensão inconsistente no chunk {id_chunk}")
+
+                vetores.write(vetor.tobytes())
+                colunas["ids"].escrever_linha(id_chunk)
+                colunas["documents"].escrever_linha(lote["documents"][indice])
+                colunas["metadatas"].escrever_linha(lote["metadatas"][indice])
+                total += 1
+
+        arquivos = {ARQUIVO_VETORES: vetores.fechar()}
+        for nome, arquivo in colunas.items():
+            arquivos[f"{nome}.jsonl"] = arquivo.fechar()
+
+        if snapshot_base:
+            removidos = _ArquivoComHash(os.path.join(temporario, ARQUIVO_REMOVIDOS))
+            for id_chunk in sorted(ids_base - ids_atuais):
+                removidos.escrever_linha(id_chunk)
+            arquivos[ARQUIVO_REMOVIDOS] = removidos.fechar()
+
+        manifesto = {
+            "formato": FORMATO,
+            "versao": VERSAO_FORMATO,
+            "id": uuid.uuid4().hex,
+            "base": snapshot_base.id if snapshot_base else None,
+            "caminho_base": os.path.abspath(base) if base else None,
+            "criado_em": datetime.now(timezone.utc).isoformat(),
+            "colecao": settings.CHROMA_COLLECTION_NAME,
+            "total": total,
+            "dimensao": dimensao,
+            "dtype": DTYPE,
+            "arquivos": arquivos
+        }
+        with open(os.path.join(temporario, ARQUIVO_MANIFESTO), "w", encoding="utf-8") as arquivo:
+            json.dump(manifesto, arquivo, indent=2)
+    except BaseException:
+        shutil.rmtree(temporario, ignore_errors=True)
+        raise
+
+    os.replace(temporario, destino)
+    return manifesto
+
+def _em_lotes(valores: Iterator, tamanho: int) -> Iterator[List]:
+    lote = []
+    for valor in valores:
+        lote.append(valor)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def _verificar_dimensao(colecao, snapshot: Snapshot) -> None:
+    """Garante que os vetores do snapshot têm a mesma dimensão dos já existentes na coleção"""
+    if not snapshot.manifesto["total"]:
+        return
+    amostra = colecao.get(limit=1, include=["embeddings"])
+    if amostra["ids"] and len(amostra["embeddings"][0]) != snapshot.manifesto["dimensao"]:
+        raise SnapshotError(
+            f"Dimensão do snapshot ({snapshot.manifesto['dimensao']}) difere da coleção "
+            f"({len(amostra['embeddings'][0])})"
+        )
+
+def importar_snapshot(origem: str, forcar: bool = False) -> dict:
+    """
+    Importa um snapshot para a coleção, sem recalcular embeddings.
+
+    Depois de um snapshot completo, a coleção contém exatamente os chunks do
+    snapshot. Um delta só é aplicado se o último snapshot importado neste
+    banco for a sua base, a menos que `forcar` seja verdadeiro.
+    """
+    snapshot = Snapshot(origem)
+
+    ultimo = None
+    if os.path.exists(_arquivo_estado()):
+        with open(_arquivo_estado(), "r", encoding="utf-8") as arquivo:
+            ultimo = json.load(arquivo).get("ultimo_snapshot")
+    if snapshot.base and snapshot.base != ultimo and not forcar:
+        raise SnapshotError(
+            f"Delta baseado em {snapshot.base}, mas o último snapshot importado é {ultimo}"
+        )
+
+    colecao = get_vectorstore()._collection
+    # Validar antes de qualquer alteração, para não deixar a réplica pela metade
+    _verificar_dimensao(colecao, snapshot)
+
+    # Durante a importação o banco não corresponde a nenhum snapshot; se ela
+    # falhar, deltas posteriores não podem ser aplicados sobre ele
+    if os.path.exists(_arquivo_estado()):
+        os.remove(_arquivo_estado())
+
+    ids_anteriores = set()
+    if not snapshot.base:
+        ids_anteriores = set(colecao.get(include=[])["ids"])
+
+    removidos = 0
+    for lote in _em_lotes(snapshot.removidos(), TAMANHO_LOTE):
+        colecao.delete(ids=lote)
+        removidos += len(lote)
+
+    linhas = zip(snapshot.coluna("ids"), snapshot.coluna("documents"), snapshot.coluna("metadatas"))
+    inicio = 0
+    for lote in _em_lotes(linhas, TAMANHO_LOTE):
+        ids, documentos, metadados = zip(*lote)
+        fim = inicio + len(ids)
+        colecao.upsert(
+            ids=list(ids),
+            embeddings=snapshot.vetores[inicio:fim].tolist(),
+            documents=list(documentos),
+            metadatas=list(metadados)
+        )
+        ids_anteriores.difference_update(ids)
+        inicio = fim
+
+    # Snapshot completo: remover os chunks que não fazem parte dele
+    for lote in _em_lotes(iter(sorted(ids_anteriores)), TAMANHO_LOTE):
+        colecao.delete(ids=lote)
+        removidos += len(lote)
+
+    os.makedirs(settings.DB_DIR, exist_ok=True)
+    with open(_arquivo_estado(), "w", encoding="utf-8") as arquivo:
+        json.dump({"ultimo_snapshot": snapshot.id}, arquivo)
+    bump_collection_version()
+
+    return {"snapshot": snapshot.id, "importados": inicio, "removidos": removidos}
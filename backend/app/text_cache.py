@@ -0,0 +1,54 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import List, Optional
+
+import pypdf
+
+from app.config import settings
+
+# Versão do extrator: mudar a biblioteca ou a forma de extração invalida o cache
+EXTRACTOR_VERSION = f"pypdf-{pypdf.__version__}-1"
+
+class TextCache:
+    """Cache persistente do texto extraído de cada página dos PDFs"""
+
+    def __init__(self, diretorio: Optional[str] = None):
+        self.diretorio = diretorio or settings.TEXT_CACHE_DIR
+
+    @staticmethod
+    def hash_arquivo(caminho: str) -> str:
+        """Calcula o hash SHA-256 do conteúdo do arquivo"""
+        sha = hashlib.sha256()
+        with open(caminho, "rb") as arquivo:
+            for bloco in iter(lambda: arquivo.read(1024 * 1024), b""):
+                sha.update(bloco)
+        return sha.hexdigest()
+
+    def _caminho_entrada(self, hash_arquivo: str) -> str:
+        nome = f"{hash_arquivo}.{EXTRACTOR_VERSION}.json.gz"
+        return os.path.join(self.diretorio, hash_arquivo[:2], nome)
+
+    def obter(self, hash_arquivo: str) -> Optional[List[str]]:
+        """Retorna o texto das páginas em cache, ou None se não houver entrada válida"""
+        caminho = self._caminho_entrada(hash_arquivo)
+        if not os.path.exists(caminho):
+            return None
+
+        try:
+            with gzip.open(caminho, "rt", encoding="utf-8") as arquivo:
+                return json.load(arquivo)["paginas"]
+        except (OSError, ValueError, KeyError):
+            # Entrada corrompida é tratada como ausente e será regravada
+            return None
+
+    def salvar(self, hash_arquivo: str, paginas: List[str]) -> None:
+        """Grava o texto das páginas de forma atômica"""
+        caminho = self._caminho_entrada(hash_arquivo)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with gzip.open(temporario, "wt", encoding="utf-8") as arquivo:
+            json.dump({"extrator": EXTRACTOR_VERSION, "paginas": paginas}, arquivo, ensure_ascii=False)
+        os.replace(temporario, caminho)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark do PageTokenSplitter contra o RecursiveCharacterTextSplitter
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.config import settings
+from app.services import DocumentService, PageTokenSplitter
+
+# Média aproximada de caracteres por token, usada para dimensionar o splitter por caracteres
+CARACTERES_POR_TOKEN = 4
+
+def criar_splitters(chunk_size: int, chunk_overlap: int) -> dict:
+    """Cria os splitters comparados com parâmetros equivalentes"""
+    return {
+        "RecursiveCharacterTextSplitter (len)": RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size * CARACTERES_POR_TOKEN,
+            chunk_overlap=chunk_overlap * CARACTERES_POR_TOKEN,
+            length_function=len,
+            add_start_index=True
+        ),
+        "RecursiveCharacterTextSplitter (tiktoken)": RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name=settings.TOKENIZER_ENCODING,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            add_start_index=True
+        ),
+        "PageTokenSplitter": PageTokenSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            encoding_name=settings.TOKENIZER_ENCODING
+        ),
+    }
+
+def medir(splitter, documentos: list) -> dict:
+    """Mede tempo, chunks/s e memória de pico de um splitter"""
+    inicio = time.perf_counter()
+    chunks = splitter.split_documents(documentos)
+    duracao = time.perf_counter() - inicio
+
+    # Memória medida em uma segunda execução para não distorcer o tempo. O
+    # tracemalloc só enxerga blocos vivos, então apenas o pico é medido; o
+    # número total de alocações não é contado
+    tracemalloc.start()
+    chunks = splitter.split_documents(documentos)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "chunks": len(chunks),
+        "segundos": duracao,
+        "chunks_por_segundo": len(chunks) / duracao if duracao else float("inf"),
+        "pico_mb": pico / (1024 * 1024),
+    }
+
+def main():
+    """Executa o benchmark sobre o texto em cache dos PDFs da pasta base"""
+    parser = argparse.ArgumentParser(description="Compara splitters de texto")
+    parser.add_argument("--chunk-size", type=int, default=settings.CHUNK_SIZE_TOKENS)
+    parser.add_argument("--chunk-overlap", type=int, default=settings.CHUNK_OVERLAP_TOKENS)
+    parser.add_argument(
+        "--repeticoes", type=int, default=100,
+        help="Quantas vezes o corpus é replicado para simular uma base grande"
+    )
+    args = parser.parse_args()
+
+    documentos = DocumentService.carregar_documentos() * args.repeticoes
+    total_caracteres = sum(len(documento.page_content) for documento in documentos)
+    print(f"📚 Corpus: {len(documentos)} páginas, {total_caracteres / 1e6:.1f} M caracteres")
+    print(f"   chunk_size={args.chunk_size} chunk_overlap={args.chunk_overlap} (tokens)")
+    print("   memória: apenas o pico alocado durante a divisão (tracemalloc); alocações não são contadas")
+    print("-" * 50)
+
+    for nome, splitter in criar_splitters(args.chunk_size, args.chunk_overlap).items():
+        resultado = medir(splitter, documentos)
+        print(f"🔍 {nome}")
+        print(f"   chunks: {resultado['chunks']}")
+        print(f"   tempo: {resultado['segundos']:.2f}s ({resultado['chunks_por_segundo']:.0f} chunks/s)")
+        print(f"   memória de pico: {resultado['pico_mb']:.1f} MB")
+        print("-" * 30)
+
+if __name__ == "__main__":
+    main()
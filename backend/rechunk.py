@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Script para recriar chunks e embeddings a partir do texto já extraído dos PDFs
+"""
+
+import argparse
+import sys
+
+from app.config import settings
+from app.services import DocumentService
+
+def main():
+    """Recria o banco vetorial com novos parâmetros de chunking"""
+    parser = argparse.ArgumentParser(
+        description="Recria chunks e embeddings usando apenas o texto em cache"
+    )
+    parser.add_argument("--chunk-size", type=int, default=settings.CHUNK_SIZE_TOKENS)
+    parser.add_argument("--chunk-overlap", type=int, default=settings.CHUNK_OVERLAP_TOKENS)
+    args = parser.parse_args()
+
+    print(f"♻️  Recriando chunks a partir do cache em {settings.TEXT_CACHE_DIR}/")
+    print(f"   chunk_size={args.chunk_size} chunk_overlap={args.chunk_overlap}")
+
+    try:
+        paginas, chunks = DocumentService.reprocessar_do_cache(
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap
+        )
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        print("   Execute POST /documents/processar para extrair o texto dos PDFs novos")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"❌ Parâmetros de chunking inválidos: {e}")
+        sys.exit(1)
+
+    print(f"✅ {paginas} páginas divididas em {chunks} chunks")
+
+if __name__ == "__main__":
+    main()
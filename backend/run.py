@@ -3,18 +3,84 @@
 Script principal para executar a aplicação PDF RAG API
 """
 
+import argparse
+import multiprocessing
+import os
+import secrets
+
 import uvicorn
 from app.config import settings
 
+def iniciar_dono_do_indice() -> multiprocessing.Process:
+    """Inicia o processo dono do índice e exporta seu endereço para os workers"""
+    from app.index_client import ARQUIVO_SOCKET, aguardar_servidor, endereco_local, salvar_chave
+    from app.index_server import servir
+
+    endereco = settings.INDEX_SERVER_ADDRESS or os.path.join(settings.DB_DIR, ARQUIVO_SOCKET)
+    if not settings.INDEX_SERVER_AUTHKEY and not endereco_local(endereco):
+        raise SystemExit(
+            f"INDEX_SERVER_AUTHKEY deve ser definida para servir o índice fora do loopback ({endereco})"
+        )
+    # A chave autentica os workers, que podem enviar objetos arbitrários ao dono do índice
+    authkey = settings.INDEX_SERVER_AUTHKEY
+    if not authkey:
+        authkey = secrets.token_bytes(32).hex()
+        # Scripts como o rechunk.py leem a chave gerada deste arquivo para usar o servidor
+        print(f"Chave do índice gravada em: {salvar_chave(settings.DB_DIR, authkey)}")
+
+    processo = multiprocessing.Process(target=servir, args=(endereco, authkey), daemon=True)
+    processo.start()
+    aguardar_servidor(endereco, authkey, ativo=processo.is_alive)
+
+    # Os workers do uvicorn são processos novos e leem a configuração do ambiente
+    os.environ["INDEX_SERVER_ADDRESS"] = endereco
+    os.environ["INDEX_SERVER_AUTHKEY"] = authkey
+    print(f"Índice servido em: {endereco}")
+    return processo
+
+def encerrar_dono_do_indice(processo: multiprocessing.Process) -> None:
+    """Encerra o processo dono do índice e remove a chave gerada para ele"""
+    from app.index_client import ARQUIVO_CHAVE
+
+    processo.terminate()
+    if not settings.INDEX_SERVER_AUTHKEY:
+        caminho_chave = os.path.join(settings.DB_DIR, ARQUIVO_CHAVE)
+        if os.path.exists(caminho_chave):
+            os.remove(caminho_chave)
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Executa a {settings.APP_NAME}")
+    parser.add_argument("--workers", type=int, default=settings.WORKERS)
+    args = parser.parse_args()
+
+    # O limite global de gerações é dividido entre os workers
+    if settings.ADMISSION_MAX_CONCURRENT < args.workers:
+        raise SystemExit(
+            f"ADMISSION_MAX_CONCURRENT ({settings.ADMISSION_MAX_CONCURRENT}) deve ser pelo menos "
+            f"o número de workers ({args.workers})"
+        )
+    # Os workers do uvicorn leem o número de workers do ambiente para dividir os limites
+    os.environ["WORKERS"] = str(args.workers)
+
     print(f"Iniciando {settings.APP_NAME} v{settings.APP_VERSION}")
     print(f"Modo debug: {settings.DEBUG}")
+    print(f"Workers: {args.workers}")
     print(f"Documentação disponível em: http://localhost:8000/docs")
-    
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=settings.DEBUG,
-        log_level="info"
-    ) 
\ No newline at end of file
+
+    # Com INDEX_SERVER_ADDRESS definido, as requisições sempre vão ao dono do
+    # índice, então ele é iniciado mesmo com um único worker
+    usar_dono_do_indice = args.workers > 1 or bool(settings.INDEX_SERVER_ADDRESS)
+    dono_do_indice = iniciar_dono_do_indice() if usar_dono_do_indice else None
+
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=settings.DEBUG and args.workers == 1,
+            workers=args.workers,
+            log_level="info"
+        )
+    finally:
+        if dono_do_indice is not None:
+            encerrar_dono_do_indice(dono_do_indice)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Script para exportar e importar snapshots do banco vetorial
+"""
+
+import argparse
+import sys
+
+from app.snapshot import SnapshotError, exportar_snapshot, importar_snapshot
+
+def main():
+    """Exporta ou importa um snapshot do banco vetorial"""
+    parser = argparse.ArgumentParser(description="Snapshots do banco vetorial")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    exportar = comandos.add_parser("exportar", help="Exporta a coleção para um snapshot")
+    exportar.add_argument("destino", help="Diretório do novo snapshot")
+    exportar.add_argument("--base", help="Snapshot base, para gerar um delta")
+
+    importar = comandos.add_parser("importar", help="Importa um snapshot para a coleção")
+    importar.add_argument("origem", help="Diretório do snapshot")
+    importar.add_argument("--forcar", action="store_true", help="Aplica um delta mesmo fora de ordem")
+
+    args = parser.parse_args()
+
+    try:
+        if args.comando == "exportar":
+            print(f"📦 Exportando snapshot para {args.destino}...")
+            manifesto = exportar_snapshot(args.destino, base=args.base)
+            tipo = f"delta de {manifesto['base']}" if manifesto["base"] else "completo"
+            print(f"✅ Snapshot {manifesto['id']} ({tipo}): {manifesto['total']} chunks")
+        else:
+            print(f"📥 Importando snapshot de {args.origem}...")
+            resultado = importar_snapshot(args.origem, forcar=args.forcar)
+            print(f"✅ Snapshot {resultado['snapshot']}: {resultado['importados']} chunks importados, "
+                  f"{resultado['removidos']} removidos")
+    except (SnapshotError, FileExistsError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from app.admission import AdmissionController, AdmissionRejected, parcela_por_worker
+
+def criar_controlador(**kwargs) -> AdmissionController:
+    parametros = {"max_concorrentes": 1, "max_por_cliente": 5, "tamanho_fila": 5, "espera_maxima": 5.0}
+    parametros.update(kwargs)
+    controlador = AdmissionController(**parametros)
+    # Duração curta para que a estimativa de espera não recuse as requisições dos testes
+    controlador._duracao_media = 0.01
+    return controlador
+
+def test_admite_ate_o_limite_global_e_libera():
+    async def cenario():
+        controlador = criar_controlador(max_concorrentes=2)
+        await controlador.adquirir("a")
+        await controlador.adquirir("b")
+        assert controlador.metricas()["em_execucao"] == 2
+
+        controlador.liberar("a", 0.01)
+        controlador.liberar("b", 0.01)
+        assert controlador.metricas()["em_execucao"] == 0
+        assert controlador.metricas()["clientes_ativos"] == 0
+
+    asyncio.run(cenario())
+
+def test_recusa_cliente_acima_do_limite_com_429():
+    async def cenario():
+        controlador = criar_controlador(max_concorrentes=5, max_por_cliente=1)
+        await controlador.adquirir("a")
+        with pytest.raises(AdmissionRejected) as erro:
+            await controlador.adquirir("a")
+        assert erro.value.status_code == 429
+        assert erro.value.retry_after >= 1
+
+    asyncio.run(cenario())
+
+def test_recusa_com_503_quando_a_fila_esta_cheia():
+    async def cenario():
+        controlador = criar_controlador(tamanho_fila=1)
+        await controlador.adquirir("a")
+        na_fila = asyncio.create_task(controlador.adquirir("b"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as erro:
+            await controlador.adquirir("c")
+        assert erro.value.status_code == 503
+
+        controlador.liberar("a", 0.01)
+        await na_fila
+        assert controlador.metricas()["em_execucao"] == 1
+
+    asyncio.run(cenario())
+
+def test_fila_atende_o_prazo_mais_proximo_primeiro():
+    async def cenario():
+        controlador = criar_controlador()
+        await controlador.adquirir("inicial")
+        ordem = []
+
+        async def esperar(cliente, timeout):
+            await controlador.adquirir(cliente, timeout)
+            ordem.append(cliente)
+            await asyncio.sleep(0)
+            controlador.liberar(cliente, 0.01)
+
+        tarefas = [
+            asyncio.create_task(esperar("prazo_longo", 4)),
+            asyncio.create_task(esperar("prazo_curto", 1)),
+            asyncio.create_task(esperar("sem_prazo", None)),
+        ]
+        await asyncio.sleep(0)
+        controlador.liberar("inicial", 0.01)
+        await asyncio.gather(*tarefas)
+
+        assert ordem == ["prazo_curto", "prazo_longo", "sem_prazo"]
+
+    asyncio.run(cenario())
+
+def test_prazo_esgotado_na_fila_gera_503():
+    async def cenario():
+        controlador = criar_controlador()
+        await controlador.adquirir("a")
+
+        with pytest.raises(AdmissionRejected) as erro:
+            await controlador.adquirir("b", timeout=0.05)
+        assert erro.value.status_code == 503
+
+        metricas = controlador.metricas()
+        assert metricas["expiradas_na_fila"] == 1
+        assert metricas["na_fila"] == 0
+        assert metricas["clientes_ativos"] == 1
+
+    asyncio.run(cenario())
+
+def test_cancelamento_na_fila_nao_vaza_vaga():
+    async def cenario():
+        controlador = criar_controlador()
+        await controlador.adquirir("a")
+        cancelada = asyncio.create_task(controlador.adquirir("b"))
+        seguinte = asyncio.create_task(controlador.adquirir("c"))
+        await asyncio.sleep(0)
+
+        cancelada.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelada
+
+        controlador.liberar("a", 0.01)
+        await seguinte
+        metricas = controlador.metricas()
+        assert metricas["em_execucao"] == 1
+        assert metricas["na_fila"] == 0
+        assert metricas["clientes_ativos"] == 1
+
+    asyncio.run(cenario())
+
+def test_vaga_concedida_a_requisicao_cancelada_passa_para_a_proxima():
+    async def cenario():
+        controlador = criar_controlador()
+        await controlador.adquirir("a")
+        desistente = asyncio.create_task(controlador.adquirir("b"))
+        seguinte = asyncio.create_task(controlador.adquirir("c"))
+        await asyncio.sleep(0)
+
+        # A vaga é concedida a "b", que é cancelada antes de voltar a executar
+        controlador.liberar("a", 0.01)
+        desistente.cancel()
+        resultado, = await asyncio.gather(desistente, return_exceptions=True)
+        if not isinstance(resultado, BaseException):
+            # Algumas versões do asyncio entregam a vaga já concedida em vez de
+            # propagar o cancelamento; nesse caso quem a recebeu a devolve
+            controlador.liberar("b", 0.01)
+
+        await seguinte
+        assert controlador.metricas()["em_execucao"] == 1
+        assert controlador.metricas()["clientes_ativos"] == 1
+
+    asyncio.run(cenario())
+
+def test_recusa_na_hora_quando_a_espera_estimada_excede_o_prazo():
+    async def cenario():
+        controlador = criar_controlador()
+        controlador._duracao_media = 10.0
+        await controlador.adquirir("a")
+
+        with pytest.raises(AdmissionRejected) as erro:
+            await controlador.adquirir("b", timeout=1)
+        assert erro.value.status_code == 503
+        assert controlador.metricas()["recusadas_por_sobrecarga"] == 1
+
+    asyncio.run(cenario())
+
+def test_parcelas_dos_workers_nao_ultrapassam_o_limite_global():
+    assert parcela_por_worker(8, 1) == 8
+    assert parcela_por_worker(8, 3) * 3 <= 8
+    assert parcela_por_worker(32, 4) == 8
+    assert parcela_por_worker(8, 0) == 8
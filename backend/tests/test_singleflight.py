@@ -0,0 +1,168 @@
+import threading
+import time
+
+import pytest
+
+from app.singleflight import SingleFlight, StreamCancelled
+
+def iniciar_em_threads(funcao, quantidade: int) -> tuple:
+    """Inicia `funcao()` em várias threads; retorna as threads e a lista que recebe os resultados (ou exceções)"""
+    resultados = [None] * quantidade
+
+    def executar(indice):
+        try:
+            resultados[indice] = funcao()
+        except Exception as e:
+            resultados[indice] = e
+
+    threads = [threading.Thread(target=executar, args=(indice,)) for indice in range(quantidade)]
+    for thread in threads:
+        thread.start()
+    return threads, resultados
+
+def test_seguidores_recebem_o_resultado_do_lider():
+    coalescidas = SingleFlight()
+    liberar = threading.Event()
+    chamadas = []
+
+    def calcular():
+        chamadas.append(1)
+        liberar.wait(5)
+        return "resposta"
+
+    threads, resultados = iniciar_em_threads(lambda: coalescidas.executar("chave", calcular), 5)
+    # Dar tempo para todas as threads chegarem enquanto o líder ainda executa
+    time.sleep(0.1)
+    liberar.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert resultados == ["resposta"] * 5
+    assert len(chamadas) == 1
+
+def test_seguidores_recebem_a_excecao_do_lider():
+    coalescidas = SingleFlight()
+    liberar = threading.Event()
+
+    def falhar():
+        liberar.wait(5)
+        raise ValueError("falhou")
+
+    threads, resultados = iniciar_em_threads(lambda: coalescidas.executar("chave", falhar), 3)
+    time.sleep(0.1)
+    liberar.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(resultado, ValueError) for resultado in resultados)
+    assert {str(resultado) for resultado in resultados} == {"falhou"}
+
+def test_chave_e_liberada_depois_da_execucao():
+    coalescidas = SingleFlight()
+    chamadas = []
+
+    def calcular():
+        chamadas.append(1)
+        return len(chamadas)
+
+    assert coalescidas.executar("chave", calcular) == 1
+    assert coalescidas.executar("chave", calcular) == 2
+
+    with pytest.raises(ValueError):
+        coalescidas.executar("falha", lambda: int("x"))
+    assert coalescidas.executar("falha", lambda: 0) == 0
+
+def test_leitor_atrasado_recebe_as_partes_ja_geradas():
+    coalescidas = SingleFlight()
+    continuar = threading.Event()
+
+    def gerar():
+        yield "a"
+        yield "b"
+        continuar.wait(5)
+        yield "c"
+
+    transmissao = coalescidas.transmitir("chave", gerar)
+    primeiro = transmissao.acompanhar()
+    assert next(primeiro) == "a"
+    assert next(primeiro) == "b"
+
+    # Quem chega depois compartilha a mesma geração e recebe tudo desde o início
+    atrasado = coalescidas.transmitir("chave", lambda: iter(["outra geração"]))
+    assert atrasado is transmissao
+    continuar.set()
+
+    assert list(atrasado.acompanhar()) == ["a", "b", "c"]
+    assert list(primeiro) == ["c"]
+
+def test_aguardar_inicio_levanta_o_erro_do_produtor():
+    coalescidas = SingleFlight()
+
+    def gerar():
+        raise ConnectionError("LLM indisponível")
+        yield
+
+    transmissao = coalescidas.transmitir("chave", gerar)
+    with pytest.raises(ConnectionError):
+        transmissao.aguardar_inicio()
+
+def test_erro_depois_do_inicio_chega_aos_leitores():
+    coalescidas = SingleFlight()
+
+    def gerar():
+        yield "a"
+        raise ConnectionError("conexão perdida")
+
+    transmissao = coalescidas.transmitir("chave", gerar)
+    transmissao.aguardar_inicio()
+    leitor = transmissao.acompanhar()
+
+    assert next(leitor) == "a"
+    with pytest.raises(ConnectionError):
+        next(leitor)
+
+def test_geracao_e_interrompida_quando_o_ultimo_leitor_sai():
+    coalescidas = SingleFlight()
+    fechado = threading.Event()
+
+    def gerar():
+        try:
+            while True:
+                yield "parte"
+                time.sleep(0.01)
+        finally:
+            fechado.set()
+
+    transmissao = coalescidas.transmitir("chave", gerar)
+    leitores = [transmissao.acompanhar(), transmissao.acompanhar()]
+    for leitor in leitores:
+        next(leitor)
+
+    leitores[0].close()
+    assert not fechado.wait(0.1)
+
+    leitores[1].close()
+    assert fechado.wait(5)
+    with pytest.raises(StreamCancelled):
+        transmissao.acompanhar()
+
+    # A próxima requisição com a mesma chave inicia uma nova geração
+    nova = coalescidas.transmitir("chave", lambda: iter(["nova"]))
+    assert nova is not transmissao
+    assert list(nova.acompanhar()) == ["nova"]
+
+def test_reserva_abandonada_entrega_o_erro_e_libera_a_chave():
+    coalescidas = SingleFlight()
+    lider = coalescidas.reservar("chave")
+    seguidor = coalescidas.reservar("chave")
+    assert lider.lider and not seguidor.lider
+    assert seguidor.futuro is lider.futuro
+
+    lider.abandonar(TimeoutError("sem vaga"))
+    with pytest.raises(TimeoutError):
+        seguidor.futuro.result()
+
+    # Concluir depois de abandonar não tem efeito sobre quem já recebeu o erro
+    lider.concluir(lambda: "tarde")
+    assert isinstance(seguidor.futuro.exception(), TimeoutError)
+    assert coalescidas.reservar("chave").lider
@@ -0,0 +1,156 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain_chroma")
+
+from app import snapshot
+from app.config import settings
+from app.snapshot import ARQUIVO_VETORES, SnapshotError, exportar_snapshot, importar_snapshot
+
+class ColecaoEmMemoria:
+    """Coleção falsa com a parte da API do ChromaDB usada pelos snapshots"""
+
+    def __init__(self, chunks: dict = None):
+        # id -> (embedding, documento, metadados), na ordem de inserção
+        self.chunks = dict(chunks or {})
+        self.escritas = 0
+
+    def get(self, ids=None, include=None, limit=None, offset=None) -> dict:
+        selecionados = list(self.chunks.items())
+        if ids is not None:
+            selecionados = [(id_chunk, valor) for id_chunk, valor in selecionados if id_chunk in ids]
+        inicio = offset or 0
+        fim = inicio + limit if limit is not None else None
+        selecionados = selecionados[inicio:fim]
+
+        resultado = {"ids": [id_chunk for id_chunk, _ in selecionados]}
+        for indice, campo in enumerate(("embeddings", "documents", "metadatas")):
+            if include is None or campo in include:
+                resultado[campo] = [valor[indice] for _, valor in selecionados]
+        return resultado
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.escritas += 1
+        for id_chunk, embedding, documento, metadados in zip(ids, embeddings, documents, metadatas):
+            self.chunks[id_chunk] = (list(embedding), documento, metadados)
+
+    def delete(self, ids) -> None:
+        self.escritas += 1
+        for id_chunk in ids:
+            self.chunks.pop(id_chunk, None)
+
+def chunk(numero: int, dimensao: int = 3) -> tuple:
+    embedding = [float(numero + indice) / 10 for indice in range(dimensao)]
+    return embedding, f"texto {numero}", {"source": "doc.pdf", "page": numero}
+
+def criar_colecao(*numeros: int, dimensao: int = 3) -> ColecaoEmMemoria:
+    return ColecaoEmMemoria({f"id-{numero}": chunk(numero, dimensao) for numero in numeros})
+
+@pytest.fixture
+def usar_colecao(monkeypatch, tmp_path):
+    """Aponta o módulo de snapshots para uma coleção em memória e um DB_DIR temporário"""
+    monkeypatch.setattr(settings, "DB_DIR", str(tmp_path / "db"))
+    monkeypatch.setattr(snapshot, "bump_collection_version", lambda: 0)
+
+    def usar(colecao: ColecaoEmMemoria) -> ColecaoEmMemoria:
+        monkeypatch.setattr(snapshot, "get_vectorstore", lambda: SimpleNamespace(_collection=colecao))
+        return colecao
+
+    return usar
+
+@pytest.fixture(autouse=True)
+def lotes_pequenos(monkeypatch):
+    """Reduz o lote para exercitar a paginação com poucos chunks"""
+    monkeypatch.setattr(snapshot, "TAMANHO_LOTE", 2)
+
+def test_snapshot_completo_ida_e_volta(usar_colecao, tmp_path):
+    origem = usar_colecao(criar_colecao(1, 2, 3, 4, 5))
+    manifesto = exportar_snapshot(str(tmp_path / "completo"))
+    assert manifesto["total"] == 5
+    assert manifesto["dimensao"] == 3
+
+    destino = usar_colecao(ColecaoEmMemoria())
+    resultado = importar_snapshot(str(tmp_path / "completo"))
+
+    assert resultado["importados"] == 5
+    assert list(destino.chunks) == list(origem.chunks)
+    for id_chunk, (embedding, documento, metadados) in origem.chunks.items():
+        assert destino.chunks[id_chunk][0] == pytest.approx(embedding)
+        assert destino.chunks[id_chunk][1:] == (documento, metadados)
+
+def test_delta_aplicado_sobre_a_base(usar_colecao, tmp_path):
+    origem = usar_colecao(criar_colecao(1, 2, 3))
+    exportar_snapshot(str(tmp_path / "base"))
+
+    origem.delete(ids=["id-2"])
+    origem.chunks["id-4"] = chunk(4)
+    manifesto = exportar_snapshot(str(tmp_path / "delta"), base=str(tmp_path / "base"))
+    assert manifesto["total"] == 1
+
+    destino = usar_colecao(ColecaoEmMemoria())
+    importar_snapshot(str(tmp_path / "base"))
+    resultado = importar_snapshot(str(tmp_path / "delta"))
+
+    assert resultado == {"snapshot": manifesto["id"], "importados": 1, "removidos": 1}
+    assert sorted(destino.chunks) == ["id-1", "id-3", "id-4"]
+
+def test_delta_recusado_sobre_outra_base(usar_colecao, tmp_path):
+    origem = usar_colecao(criar_colecao(1, 2))
+    exportar_snapshot(str(tmp_path / "base"))
+    origem.chunks["id-3"] = chunk(3)
+    exportar_snapshot(str(tmp_path / "outro"))
+    exportar_snapshot(str(tmp_path / "delta"), base=str(tmp_path / "base"))
+
+    destino = usar_colecao(ColecaoEmMemoria())
+    with pytest.raises(SnapshotError):
+        importar_snapshot(str(tmp_path / "delta"))
+
+    importar_snapshot(str(tmp_path / "outro"))
+    escritas = destino.escritas
+    with pytest.raises(SnapshotError):
+        importar_snapshot(str(tmp_path / "delta"))
+    assert destino.escritas == escritas
+
+@pytest.mark.parametrize("corromper", ["inverter_byte", "truncar"])
+def test_vetores_corrompidos_sao_recusados_antes_de_escrever(usar_colecao, tmp_path, corromper):
+    usar_colecao(criar_colecao(1, 2, 3))
+    exportar_snapshot(str(tmp_path / "completo"))
+
+    caminho = os.path.join(tmp_path / "completo", ARQUIVO_VETORES)
+    with open(caminho, "rb") as arquivo:
+        dados = bytearray(arquivo.read())
+    if corromper == "inverter_byte":
+        dados[5] ^= 0xFF
+    else:
+        dados = dados[:-4]
+    with open(caminho, "wb") as arquivo:
+        arquivo.write(dados)
+
+    destino = usar_colecao(criar_colecao(9))
+    with pytest.raises(SnapshotError):
+        importar_snapshot(str(tmp_path / "completo"))
+    assert destino.escritas == 0
+    assert list(destino.chunks) == ["id-9"]
+
+def test_snapshot_completo_remove_chunks_fora_dele(usar_colecao, tmp_path):
+    usar_colecao(criar_colecao(1, 2))
+    exportar_snapshot(str(tmp_path / "completo"))
+
+    destino = usar_colecao(criar_colecao(1, 7, 8, 9))
+    resultado = importar_snapshot(str(tmp_path / "completo"))
+
+    assert sorted(destino.chunks) == ["id-1", "id-2"]
+    assert resultado["removidos"] == 3
+
+def test_dimensao_diferente_e_recusada_antes_de_escrever(usar_colecao, tmp_path):
+    usar_colecao(criar_colecao(1, 2))
+    exportar_snapshot(str(tmp_path / "completo"))
+
+    destino = usar_colecao(criar_colecao(5, dimensao=4))
+    with pytest.raises(SnapshotError):
+        importar_snapshot(str(tmp_path / "completo"))
+    assert destino.escritas == 0
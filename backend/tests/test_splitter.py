@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("langchain")
+tiktoken = pytest.importorskip("tiktoken")
+
+from langchain.schema import Document
+
+from app.services import PageTokenSplitter
+
+@pytest.fixture(autouse=True)
+def encoding_por_bytes(monkeypatch):
+    """Encoding de um token por byte, para não depender do download do cl100k_base"""
+    encoding = tiktoken.Encoding(
+        "bytes",
+        pat_str=r"""\s+|\S+""",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={}
+    )
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda nome: encoding)
+    return encoding
+
+def test_start_index_aponta_para_o_texto_do_chunk():
+    texto = "Primeira frase. Segunda frase!\n\nOutro parágrafo com acentuação.\n" * 20
+    chunks = PageTokenSplitter(60, 15).split_documents([Document(page_content=texto, metadata={"page": 3})])
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        inicio = chunk.metadata["start_index"]
+        assert texto[inicio:inicio + len(chunk.page_content)] == chunk.page_content
+        assert chunk.metadata["page"] == 3
+
+def test_chunks_respeitam_o_tamanho_em_tokens(encoding_por_bytes):
+    texto = "palavra " * 500
+    chunks = PageTokenSplitter(50, 10).split_documents([Document(page_content=texto)])
+
+    assert all(len(encoding_por_bytes.encode_ordinary(c.page_content)) <= 50 for c in chunks)
+
+def test_corta_preferencialmente_em_paragrafos():
+    paragrafo = "a" * 20 + " " + "b" * 20
+    texto = "\n\n".join([paragrafo] * 4)
+    chunks = PageTokenSplitter(60, 0).split_documents([Document(page_content=texto)])
+
+    assert [c.page_content for c in chunks] == [paragrafo] * 4
+
+def test_nao_junta_paginas_diferentes():
+    paginas = [Document(page_content="texto curto", metadata={"page": i}) for i in range(3)]
+    chunks = PageTokenSplitter(100, 10).split_documents(paginas)
+
+    assert [c.metadata["page"] for c in chunks] == [0, 1, 2]
+
+def test_sobreposicao_comeca_em_fronteira_de_palavra():
+    texto = " ".join(f"p{i:03d}" for i in range(200))
+    chunks = PageTokenSplitter(40, 10).split_documents([Document(page_content=texto)])
+
+    for anterior, atual in zip(chunks, chunks[1:]):
+        assert atual.metadata["start_index"] < anterior.metadata["start_index"] + len(anterior.page_content)
+        assert texto[atual.metadata["start_index"] - 1] == " "
+
+def test_cobre_todo_o_texto():
+    texto = " ".join(f"p{i:03d}" for i in range(200))
+    chunks = PageTokenSplitter(40, 10).split_documents([Document(page_content=texto)])
+
+    assert chunks[0].metadata["start_index"] == 0
+    assert texto.endswith(chunks[-1].page_content)
+    for anterior, atual in zip(chunks, chunks[1:]):
+        assert atual.metadata["start_index"] <= anterior.metadata["start_index"] + len(anterior.page_content)
+
+def test_pagina_vazia_nao_gera_chunks():
+    assert PageTokenSplitter(10, 2).split_documents([Document(page_content="  \n ")]) == []
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(0, 0), (-10, 0), (10, -1), (10, 10), (10, 20)])
+def test_parametros_invalidos(chunk_size, chunk_overlap):
+    with pytest.raises(ValueError):
+        PageTokenSplitter(chunk_size, chunk_overlap)